@@ -4,22 +4,29 @@
 import logging
 import hashlib
 import base64
+import json
+import os
 import re
 import string
+import time
+import uuid
 
 import inquirer
 import requests
 
 from colorlog import ColoredFormatter
-from time import sleep
 
 from cbor2 import dumps, loads
 from sawtooth_signing import create_context, CryptoFactory
 from sawtooth_sdk.protobuf.transaction_pb2 import Transaction
 from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
 from sawtooth_sdk.protobuf.batch_pb2 import BatchHeader, Batch, BatchList
+from sawtooth_sdk.protobuf.setting_pb2 import Setting
 
 from hmascii import HANGMAN
+from tracker import (
+    BatchTracker, STATUS_COMMITTED, STATUS_INVALID, STATUS_PENDING, STATUS_UNKNOWN
+)
 
 APP_NAME = "Hangman CLI"
 
@@ -27,21 +34,71 @@ APP_NAME = "Hangman CLI"
 VALIDATOR_URL = "http://rest-api:8008"
 VALIDATOR_ENDPOINT_BATCHES = VALIDATOR_URL + "/batches"
 VALIDATOR_ENDPOINT_STATE = VALIDATOR_URL + "/state/{}"
+VALIDATOR_ENDPOINT_STATE_PREFIX = VALIDATOR_URL + "/state?address={}"
 VALIDATOR_ENDPOINT_BLOCKS = VALIDATOR_URL + "/blocks?limit={}"
 
 # The prefix for the Hangman address space, translates to `b89bcb`
 HM_NAMESPACE = hashlib.sha512("hangman".encode("utf-8")).hexdigest()[0:6]
 
+# The number of hash characters of the host in address scheme v2
+HOST_HASH_LENGTH = 8
+
+# The address of the `BlockInfoConfig` of the Block Info transaction family
+BLOCK_INFO_CONFIG_ADDRESS = "00b10c01" + "0" * 62
+
+# The setting holding the number of blocks after which finished games can
+# be pruned, and the value used by the transaction processor if it isn't set
+SETTING_RETENTION_BLOCKS = "sawtooth.hm.retention_blocks"
+RETENTION_BLOCKS = 1000
+
+# The prefix for the Settings address space
+SETTINGS_NAMESPACE = "000000"
+
+# Game states, see `hangman-tp-py`, and how they're displayed
+GAME_STATE_ONGOING = 1
+GAME_STATE_WON = 2
+GAME_STATE_LOST = 3
+STATES = {
+    GAME_STATE_ONGOING: "KEEP GOING ;-)",
+    GAME_STATE_WON: "YOU WON :-)",
+    GAME_STATE_LOST: "GAME OVER :-(",
+}
+
+# The maximum number of batches sent in one request
+MAX_BATCHES_PER_REQUEST = 100
+
+# The maximum number of guesses of one game in flight when pipelining
+MAX_GUESSES_IN_FLIGHT = 4
+
+# How long to wait in seconds for a batch to commit
+COMMIT_TIMEOUT = 10
+
+# Tracing is opt-in, if set a trace id and the submit time are stamped into
+# every payload and the client side trace records are appended to this file,
+# see `hmtrace.py`
+TRACE_FILE = os.environ.get("HM_TRACE_FILE")
+TRACE_MARKER = "TRACE"
+STAGE_SUBMIT = "submit"
+STAGE_POSTED = "posted"
+
 # The main choices for our CLI
 CHOICE_CREATE_GAME = "CREATE_GAME"
 CHOICE_DELETE_GAME = "DELETE_GAME"
 CHOICE_MAKE_A_GUESS = "MAKE_A_GUESS"
+CHOICE_MAKE_GUESSES = "MAKE_GUESSES"
+CHOICE_PRUNE_GAMES = "PRUNE_GAMES"
+CHOICE_LIST_MY_GAMES = "LIST_MY_GAMES"
+CHOICE_MIGRATE_GAME = "MIGRATE_GAME"
 CHOICE_GET_LIST_OF_BLOCKS = "GET_LIST_OF_BLOCKS"
 CHOICE_EXIT = "EXIT"
 CHOICES = [
     ("Create game", CHOICE_CREATE_GAME),
     ("Delete game", CHOICE_DELETE_GAME),
     ("Make a guess", CHOICE_MAKE_A_GUESS),
+    ("Make several guesses at once", CHOICE_MAKE_GUESSES),
+    ("List my games", CHOICE_LIST_MY_GAMES),
+    ("Migrate game to host address", CHOICE_MIGRATE_GAME),
+    ("Prune finished games", CHOICE_PRUNE_GAMES),
     ("Get list of blocks", CHOICE_GET_LIST_OF_BLOCKS),
     ("Exit", CHOICE_EXIT),
 ]
@@ -90,7 +147,21 @@ def init_logging(log_level=logging.WARN):
     return logger
 
 
-def _make_hm_address(name):
+def _make_hm_host_prefix(host):
+    """
+    Creates the prefix of all games hosted by `host` in the
+    Hangman address space (address scheme v2).
+
+    Arguments:
+        host: The public key of the host.
+    Returns:
+        The prefix (`HM_NAMESPACE` + `HM_HOST`, 14 characters long).
+    """
+    return HM_NAMESPACE + \
+        hashlib.sha512(host.encode("utf-8")).hexdigest()[:HOST_HASH_LENGTH]
+
+
+def _make_hm_address(name, host=None):
     """
     Creates an address in the Hangman address space
     in order to store state information.
@@ -100,13 +171,189 @@ def _make_hm_address(name):
     - `HM_GAME`       = `ee7c82d3cdfecf6d65c3c81be0c90e7fa015db96aafbe418e197cad7c52f0c34`
     We return `HM_NAMESPACE` + `HM_GAME` to uniquely identify games in the address space.
 
+    If `host` is given the address scheme v2 is used, see `hangman-tp-py`,
+    and we return `HM_NAMESPACE` + `HM_HOST` + `HM_GAME`.
+
     Arguments:
         name: The name of the game.
+        host: The public key of the host for scheme v2, None for scheme v1.
     Returns:
         An address in the Hangman address space (70 characters long).
     """
-    return HM_NAMESPACE + \
-        hashlib.sha512(name.encode("utf-8")).hexdigest()[:64]
+    if host is None:
+        return HM_NAMESPACE + \
+            hashlib.sha512(name.encode("utf-8")).hexdigest()[:64]
+    return _make_hm_host_prefix(host) + \
+        hashlib.sha512(name.encode("utf-8")).hexdigest()[:64 - HOST_HASH_LENGTH]
+
+
+def _make_settings_address(key):
+    """
+    Creates the address of a setting in the Settings address space.
+
+    Arguments:
+        key: The key of the setting, e.g. `sawtooth.hm.retention_blocks`.
+    Returns:
+        An address in the Settings address space (70 characters long).
+    """
+    parts = key.split(".", maxsplit=3)
+    parts.extend([""] * (4 - len(parts)))
+    return SETTINGS_NAMESPACE + "".join(
+        hashlib.sha256(part.encode("utf-8")).hexdigest()[:16]
+        for part in parts
+    )
+
+
+def _make_addresses(name, action, host=None):
+    """
+    Returns the addresses a transaction reads and writes.
+    Guesses and prunes read the block number and prunes
+    read the retention setting, too. Migrations move a game
+    from address scheme v1 to v2.
+
+    Arguments:
+        name: The name of the game.
+        action: The action of the transaction.
+        host: The host for address scheme v2, None for scheme v1.
+    Returns:
+        A tuple of the lists of input and output addresses.
+    """
+    if action == "migrate":
+        outputs = [_make_hm_address(name), _make_hm_address(name, host)]
+    else:
+        outputs = [_make_hm_address(name, host)]
+    inputs = list(outputs)
+    if action in ("guess", "prune"):
+        inputs.append(BLOCK_INFO_CONFIG_ADDRESS)
+    if action == "prune":
+        inputs.append(_make_settings_address(SETTING_RETENTION_BLOCKS))
+    return inputs, outputs
+
+
+class GuessPipeline:
+    """
+    Submits the guesses of one game without waiting for each to commit.
+    Every guess depends on the transaction of the previous guess via the
+    `dependencies` header field, so the validator applies them in order
+    while several of them are in flight. If a guess turns out invalid, the
+    guesses submitted after it can never commit, so they're resubmitted
+    depending on the last guess which still can. If no guess settles
+    within `timeout` seconds the pipeline is stalled and stops waiting,
+    e.g. when the validator dropped a batch.
+
+    Arguments:
+        cli: The `HangmanCLI` to create and send transactions with.
+        name: The name of the game.
+        host: The host for address scheme v2, None for scheme v1.
+        max_in_flight: The maximum number of guesses in flight.
+        timeout: How long to wait in seconds for a guess to settle.
+    """
+
+    def __init__(self, cli, name, host=None, max_in_flight=MAX_GUESSES_IN_FLIGHT,
+                 timeout=COMMIT_TIMEOUT):
+        """Initializes the pipeline, no guess is in flight."""
+        self._cli = cli
+        self._name = name
+        self._host = host
+        self._max_in_flight = max_in_flight
+        self._timeout = timeout
+        # When a guess was last sent or settled
+        self._progress_at = time.time()
+        # Tuples of guess, transaction id and batch id, oldest first
+        self._in_flight = []
+        # The transaction the next guess depends on
+        self._last_txn_id = None
+        # The transaction of the last committed guess
+        self._committed_txn_id = None
+        self._tracker = BatchTracker(VALIDATOR_URL)
+        self.committed = []
+        self.invalid = []
+
+    def __len__(self):
+        return len(self._in_flight)
+
+    @property
+    def pending(self):
+        """The guesses still in flight, oldest first."""
+        return [guess for guess, _, _ in self._in_flight]
+
+    @property
+    def stalled(self):
+        """True if guesses are in flight but none settled within `timeout`."""
+        return bool(self._in_flight) and \
+            time.time() - self._progress_at > self._timeout
+
+    def _send(self, guess):
+        dependencies = [self._last_txn_id] if self._last_txn_id else []
+        txn = self._cli.create_txn(self._name, "guess", guess, self._host, dependencies)
+        batch = self._cli.create_batch([txn])
+        self._cli.send_batch_list(BatchList(batches=[batch]).SerializeToString())
+        self._last_txn_id = txn.header_signature
+        self._in_flight.append((guess, txn.header_signature, batch.header_signature))
+        self._tracker.add(batch.header_signature)
+        self._progress_at = time.time()
+
+    def submit(self, guess):
+        """
+        Submit a guess, waits while `max_in_flight` guesses are in flight.
+
+        Arguments:
+            guess: The letter to guess.
+        Returns:
+            True if the guess was sent, False if the pipeline stalled.
+        """
+        while len(self._in_flight) >= self._max_in_flight:
+            if self.stalled:
+                return False
+            self.poll()
+        self._send(guess)
+        return True
+
+    def poll(self):
+        """
+        Update the status of the guesses in flight, this waits up to
+        `tracker.STATUS_WAIT` seconds for a status to change.
+        """
+        statuses = {
+            batch_id: (status, messages)
+            for batch_id, status, _, messages in self._tracker.poll()
+        }
+        remaining = []
+        for i, (guess, txn_id, batch_id) in enumerate(self._in_flight):
+            status, messages = statuses.get(batch_id, (STATUS_PENDING, []))
+            if status == STATUS_COMMITTED:
+                self.committed.append(guess)
+                self._committed_txn_id = txn_id
+                self._progress_at = time.time()
+            elif status in (STATUS_INVALID, STATUS_UNKNOWN):
+                message = "; ".join(messages) if status == STATUS_INVALID \
+                    else "Dropped by the validator"
+                self.invalid.append((guess, message))
+                self._progress_at = time.time()
+                # All later guesses depend on this one, chain them anew
+                poisoned = self._in_flight[i + 1:]
+                self._in_flight = remaining
+                self._last_txn_id = remaining[-1][1] if remaining else self._committed_txn_id
+                for resubmit, _, poisoned_batch_id in poisoned:
+                    self._tracker.remove(poisoned_batch_id)
+                    self._cli.logger.info("Resubmitting guess '{}'".format(resubmit))
+                    self._send(resubmit)
+                return
+            else:
+                remaining.append((guess, txn_id, batch_id))
+        self._in_flight = remaining
+
+    def flush(self):
+        """
+        Wait until all guesses in flight are committed or invalid,
+        or the pipeline stalled.
+
+        Returns:
+            True if no guess is in flight anymore.
+        """
+        while self._in_flight and not self.stalled:
+            self.poll()
+        return not self._in_flight
 
 
 class HangmanCLI:
@@ -124,6 +371,8 @@ class HangmanCLI:
         self.signer = None
         # Set up logger
         self.logger = init_logging()
+        # Trace ids of payloads created but not posted yet
+        self._unposted_traces = []
 
     def send_get_message(self, url):
         r = requests.get(url)
@@ -132,9 +381,21 @@ class HangmanCLI:
     def decode(self, data):
         return base64.b64decode(data)
 
-    def send_post_message(self, name, action, guess):
-        batch_list_bytes = self.create_message(name, action, guess)
+    def send_post_message(self, name, action, guess, host=None):
+        batch_list_bytes = self.create_message(name, action, guess, host)
+        return self.send_batch_list(batch_list_bytes)
+
+    def trace(self, trace_id, stage, ts=None, **fields):
+        record = dict(
+            fields, trace_id=trace_id, stage=stage,
+            ts=ts if ts is not None else time.time()
+        )
+        with open(TRACE_FILE, "a") as f:
+            f.write("{} {}\n".format(TRACE_MARKER, json.dumps(record, sort_keys=True)))
+
+    def send_batch_list(self, batch_list_bytes):
         headers = {"Content-Type": "application/octet-stream"}
+        trace_ids, self._unposted_traces = self._unposted_traces, []
         r = requests.post(
             VALIDATOR_ENDPOINT_BATCHES,
             data=batch_list_bytes,
@@ -143,12 +404,21 @@ class HangmanCLI:
         ret_json = r.json()
         self.logger.debug("POST RETURN: {}".format(ret_json))
         r.raise_for_status()
+        for trace_id in trace_ids:
+            self.trace(trace_id, STAGE_POSTED)
         if "link" in ret_json:
             return ret_json["link"]
 
-    def create_message(self, name, action, guess):
-        payload_bytes = self.create_payload(name, action, guess)
-        txn_header_bytes = self.create_txn_header(name, payload_bytes)
+    def create_message(self, name, action, guess, host=None):
+        batch = self.create_batch([self.create_txn(name, action, guess, host)])
+        return BatchList(batches=[batch]).SerializeToString()
+
+    def create_txn(self, name, action, guess, host=None, dependencies=None):
+        payload_bytes = self.create_payload(name, action, guess, host)
+        inputs, outputs = _make_addresses(name, action, host)
+        txn_header_bytes = self.create_txn_header(
+            payload_bytes, inputs, outputs, dependencies
+        )
         txn_signature = self.signer.sign(txn_header_bytes)
         self.logger.debug("TXN Signature: {}".format(txn_signature))
         txn = Transaction(
@@ -157,7 +427,9 @@ class HangmanCLI:
             payload=payload_bytes
         )
         self.logger.debug("TXN: {}".format(txn))
-        txns = [txn]
+        return txn
+
+    def create_batch(self, txns):
         batch_header_bytes = self.create_batch_header(txns)
         batch_signature = self.signer.sign(batch_header_bytes)
         self.logger.debug("BATCH Signature: {}".format(batch_signature))
@@ -167,17 +439,17 @@ class HangmanCLI:
             transactions=txns
         )
         self.logger.debug("BATCH: {}".format(batch))
-        return BatchList(batches=[batch]).SerializeToString()
+        return batch
 
-    def create_txn_header(self, name, payload_bytes):
+    def create_txn_header(self, payload_bytes, inputs, outputs, dependencies=None):
         txn_header = TransactionHeader(
             family_name="hm",
             family_version="1.0",
-            inputs=[_make_hm_address(name)],
-            outputs=[_make_hm_address(name)],
+            inputs=inputs,
+            outputs=outputs,
             signer_public_key=self.signer.get_public_key().as_hex(),
             batcher_public_key=self.signer.get_public_key().as_hex(),
-            dependencies=[],
+            dependencies=dependencies or [],
             payload_sha512=hashlib.sha512(payload_bytes).hexdigest()
         )
         self.logger.debug("TXN Header: {}".format(txn_header))
@@ -191,12 +463,22 @@ class HangmanCLI:
         self.logger.debug("BATCH Header: {}".format(batch_header))
         return batch_header.SerializeToString()
 
-    def create_payload(self, name, action, guess):
-        payload = dumps({
+    def create_payload(self, name, action, guess, host=None):
+        payload = {
             "name": name,
             "action": action,
             "guess": guess,
-        })
+        }
+        if host is not None:
+            payload["host"] = host
+        if TRACE_FILE:
+            # Ignored by the game logic, only logged along the way
+            trace_ts = time.time()
+            payload["trace_id"] = uuid.uuid4().hex
+            payload["trace_ts"] = int(1000 * trace_ts)
+            self.trace(payload["trace_id"], STAGE_SUBMIT, ts=trace_ts, action=action)
+            self._unposted_traces.append(payload["trace_id"])
+        payload = dumps(payload)
         self.logger.debug("Payload: {}".format(payload))
         return payload
 
@@ -218,20 +500,116 @@ and remembered until you exit the {}""".format(APP_NAME))
                 self.interactive_loop_delete_game()
             elif choice == CHOICE_MAKE_A_GUESS:
                 self.interactive_loop_make_a_guess()
+            elif choice == CHOICE_MAKE_GUESSES:
+                self.interactive_loop_make_guesses()
+            elif choice == CHOICE_LIST_MY_GAMES:
+                self.interactive_loop_list_my_games()
+            elif choice == CHOICE_MIGRATE_GAME:
+                self.interactive_loop_migrate_game()
+            elif choice == CHOICE_PRUNE_GAMES:
+                self.interactive_loop_prune_games()
             elif choice == CHOICE_GET_LIST_OF_BLOCKS:
                 self.interactive_loop_get_list_of_blocks()
 
     def interactive_loop_create_game(self):
         name = inquirer.text(message="Enter game name")
         word = inquirer.text(message="Enter word to guess")
-        self.send_post_message(name, "create", word)
+        use_host = inquirer.confirm(
+            "Store the game under your host address?", default=True
+        )
+        host = self.public_key() if use_host else None
+        self.send_post_message(name, "create", word, host)
         print("Created game '{}' {}".format(name, self.success_symbol))
 
     def interactive_loop_delete_game(self):
         name = inquirer.text(message="Enter game name")
-        self.send_post_message(name, "delete", "")
+        host = self.ask_host()
+        self.send_post_message(name, "delete", "", host)
         print("Deleted game '{}' {}".format(name, self.success_symbol))
 
+    def get_block_number(self):
+        blocks = self.send_get_message(VALIDATOR_ENDPOINT_BLOCKS.format(1))
+        return int(blocks["data"][0]["header"]["block_num"])
+
+    def get_retention_blocks(self):
+        address = _make_settings_address(SETTING_RETENTION_BLOCKS)
+        state = self.send_get_message(VALIDATOR_ENDPOINT_STATE.format(address))
+        if "data" in state:
+            setting = Setting()
+            setting.ParseFromString(self.decode(state["data"]))
+            for entry in setting.entries:
+                if entry.key == SETTING_RETENTION_BLOCKS:
+                    return int(entry.value)
+        return RETENTION_BLOCKS
+
+    def public_key(self):
+        return self.signer.get_public_key().as_hex()
+
+    def ask_host(self):
+        host = inquirer.text(
+            message="Enter host public key (empty for games without host address)"
+        )
+        return host.strip().lower() or None
+
+    def get_games(self, prefix=HM_NAMESPACE):
+        url = VALIDATOR_ENDPOINT_STATE_PREFIX.format(prefix)
+        while url:
+            state = self.send_get_message(url)
+            for entry in state.get("data", []):
+                yield entry["address"], loads(self.decode(entry["data"]))[-1]
+            url = state.get("paging", {}).get("next")
+
+    def interactive_loop_list_my_games(self):
+        host = self.public_key()
+        # All games under our host address share a prefix, so a single
+        # prefix query returns them without scanning the whole namespace
+        games = [
+            game for _, game in self.get_games(_make_hm_host_prefix(host))
+            if game["host"] == host
+        ]
+        for game in sorted(games, key=lambda game: game["name"]):
+            print("{}\t{}".format(game["name"], STATES.get(game["state"], "")))
+        print("Number of games: {}".format(len(games)))
+        print("")
+
+    def interactive_loop_migrate_game(self):
+        name = inquirer.text(message="Enter game name")
+        self.send_post_message(name, "migrate", "", self.public_key())
+        print("Migrated game '{}' {}".format(name, self.success_symbol))
+
+    def interactive_loop_prune_games(self):
+        block_number = self.get_block_number()
+        retention_blocks = self.get_retention_blocks()
+        games = [
+            # Games stored under address scheme v1 are pruned without host.
+            # Pruning a game without end block records the current block,
+            # it can be pruned once the retention has passed.
+            (game["name"], None if address == _make_hm_address(game["name"]) else game["host"])
+            for address, game in self.get_games()
+            if game["state"] != GAME_STATE_ONGOING and
+            (game.get("ended_at") is None or
+             block_number >= game["ended_at"] + retention_blocks)
+        ]
+        # Every prune goes into its own batch, so one failing
+        # prune doesn't invalidate the others
+        tracker = BatchTracker(VALIDATOR_URL)
+        for i in range(0, len(games), MAX_BATCHES_PER_REQUEST):
+            batches = [
+                self.create_batch([self.create_txn(name, "prune", "", host)])
+                for name, host in games[i:i + MAX_BATCHES_PER_REQUEST]
+            ]
+            self.send_batch_list(BatchList(batches=batches).SerializeToString())
+            for batch in batches:
+                tracker.add(batch.header_signature)
+        print("Pruning {} games which ended before block {} or have no end block recorded".format(
+            len(games), block_number - retention_blocks
+        ))
+        tracker.wait(COMMIT_TIMEOUT)
+        print("Pruned or recorded the end of {} games {}, {} failed {}, {} pending".format(
+            tracker.committed, self.success_symbol,
+            tracker.invalid + tracker.unknown, self.failure_symbol, tracker.pending
+        ))
+
     def interactive_loop_get_list_of_blocks(self):
         number_of_blocks = 0
         number_of_blocks_to_display = 1000
@@ -260,34 +638,57 @@ and remembered until you exit the {}""".format(APP_NAME))
 
     def interactive_loop_make_a_guess(self):
         name = inquirer.text(message="Enter game name")
-        self.sub_interactive_loop_make_a_guess(name)
+        host = self.ask_host()
+        self.sub_interactive_loop_make_a_guess(name, host)
 
-    def sub_interactive_loop_make_a_guess(self, name):
+    def sub_interactive_loop_make_a_guess(self, name, host=None):
         guess = ""
         while len(guess) == 0 or len(guess) > 1:
             guess = inquirer.text(message="Type a letter to guess...")
-        link = self.send_post_message(name, "guess", guess)
-        if link:
-            status = "PENDING"
-            counter = 0
-            while status == "PENDING":
-                ret_json = self.send_get_message(link)
-                status = ret_json["data"][0]["status"]
-                counter += 1
-                sleep(1)
-                if counter >= 10:
-                    break
+        batch = self.create_batch([self.create_txn(name, "guess", guess, host)])
+        self.send_batch_list(BatchList(batches=[batch]).SerializeToString())
+        tracker = BatchTracker(VALIDATOR_URL)
+        tracker.add(batch.header_signature)
+        tracker.wait(COMMIT_TIMEOUT)
+        current_game = self.get_game(name, host)
+        self.print_game(current_game)
+        if current_game["state"] == GAME_STATE_ONGOING:
+            again = inquirer.confirm("Guess again?", default=True)
+            if again:
+                self.sub_interactive_loop_make_a_guess(name, host)
+
+    def interactive_loop_make_guesses(self):
+        name = inquirer.text(message="Enter game name")
+        host = self.ask_host()
+        letters = inquirer.text(message="Type the letters to guess...")
+        # The guesses are pipelined, each one is sent without
+        # waiting for the previous one to commit
+        pipeline = GuessPipeline(self, name, host)
+        guesses = [guess for guess in letters if not guess.isspace()]
+        unsent = []
+        for i, guess in enumerate(guesses):
+            if not pipeline.submit(guess):
+                unsent = guesses[i:]
+                break
+        pipeline.flush()
+        for guess, message in pipeline.invalid:
+            print("Guess '{}' failed: {} {}".format(guess, message, self.failure_symbol))
+        for guess in pipeline.pending:
+            print("Guess '{}' didn't commit within {}s, it may still commit later {}".format(
+                guess, COMMIT_TIMEOUT, self.failure_symbol
+            ))
+        if unsent:
+            print("Not sent: '{}' {}".format("".join(unsent), self.failure_symbol))
+        print("{} guesses committed {}".format(len(pipeline.committed), self.success_symbol))
+        self.print_game(self.get_game(name, host))
+
+    def get_game(self, name, host=None):
         state = self.send_get_message(
-            VALIDATOR_ENDPOINT_STATE.format(_make_hm_address(name))
+            VALIDATOR_ENDPOINT_STATE.format(_make_hm_address(name, host))
         )
         decoded_state = self.decode(state["data"])
         game = loads(decoded_state)
-        current_game = game[-1]
-        self.print_game(current_game)
-        if current_game["state"] == 1:
-            again = inquirer.confirm("Guess again?", default=True)
-            if again:
-                self.sub_interactive_loop_make_a_guess(name)
+        return game[-1]
 
     def print_game(self, game):
         print("{}".format(HANGMAN[len(game["misses"])]))
@@ -299,12 +700,8 @@ and remembered until you exit the {}""".format(APP_NAME))
         misses = game["misses"]
         print("Word:\t{}".format(re.sub("|".join([h for h in hidden]), "_", word)))
         print("Misses:\t{}".format(" ".join([m for m in misses])))
-        if game["state"] == 1:
-            print("State:\tKEEP GOING ;-)")
-        elif game["state"] == 2:
-            print("State:\tYOU WON :-)")
-        elif game["state"] == 3:
-            print("State:\tGAME OVER :-(")
+        if game["state"] in STATES:
+            print("State:\t{}".format(STATES[game["state"]]))
         print("")
 
     def process(self):
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3.5
+# encoding: utf-8
+
+"""
+Collects the trace records of traced transactions and prints per-stage
+latency histograms.
+
+Tracing is opt-in, the CLI stamps a trace id and the submit time into every
+payload if `HM_TRACE_FILE` is set. Each component logs a `TRACE` record,
+a JSON object, when a traced transaction reaches a stage:
+
+- `submit`, `posted`: The CLI created the payload and posted the batch,
+  written to `HM_TRACE_FILE`.
+- `apply_start`, `apply_end`: The transaction processor applied the
+  transaction, logged by `hangman-tp-py`.
+- `web_received`, `web_delivered`: The web service received the state delta
+  and sent the game update to a WebSocket client, logged by `hangman-web-py`.
+
+Pass the trace file and the logs of the other components, e.g. as saved with
+`docker logs`. Records are joined by trace id, stages recorded more than once
+(a transaction applied for several candidate blocks, an update sent to several
+clients) count with their first occurrence. The clocks of all components must
+be in sync, which they are if all containers run on the same host.
+"""
+
+import argparse
+import json
+import sys
+
+APP_NAME = "Hangman Trace Collector"
+
+# The marker trace records are logged with
+TRACE_MARKER = "TRACE {"
+
+# The stages in the order a transaction passes them
+STAGE_SUBMIT = "submit"
+STAGE_POSTED = "posted"
+STAGE_APPLY_START = "apply_start"
+STAGE_APPLY_END = "apply_end"
+STAGE_WEB_RECEIVED = "web_received"
+STAGE_WEB_DELIVERED = "web_delivered"
+
+# The latencies reported, each a name and the stages it's measured between
+SEGMENTS = [
+    ("post", STAGE_SUBMIT, STAGE_POSTED),
+    ("queue", STAGE_POSTED, STAGE_APPLY_START),
+    ("apply", STAGE_APPLY_START, STAGE_APPLY_END),
+    ("commit", STAGE_APPLY_END, STAGE_WEB_RECEIVED),
+    ("delivery", STAGE_WEB_RECEIVED, STAGE_WEB_DELIVERED),
+    ("total", STAGE_SUBMIT, STAGE_WEB_DELIVERED),
+]
+
+# The upper bounds of the histogram buckets in milliseconds
+BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+
+# The width of the longest histogram bar
+BAR_WIDTH = 40
+
+# Log lines as written by the colored console handlers of the components
+_CHECK_LINES = [
+    "\x1b[32m[2026-10-19 19:12:40.477 INFO     profiling 55]\x1b[0m \x1b[37mTRACE "
+    "{\"stage\": \"apply_start\", \"submitted\": 1, \"trace_id\": \"ab\", "
+    "\"ts\": 1792437160.477893}\x1b[0m\n",
+    "hangman-web-py  | TRACE {\"stage\": \"web_delivered\", \"trace_id\": \"ab\", "
+    "\"ts\": 1792437161.5}\n",
+    "TRACE {\"stage\": \"submit\", \"trace_id\": \"ab\", \"ts\": 1792437160.1}\n",
+]
+
+
+def read_records(f):
+    """
+    Reads the trace records of a log, other lines are skipped. Anything
+    after a record, e.g. the color reset of a colored log, is ignored.
+
+    Arguments:
+        f: The log, an iterable of lines.
+    Yields:
+        The trace records as dictionaries.
+    """
+    decoder = json.JSONDecoder()
+    for line in f:
+        pos = line.find(TRACE_MARKER)
+        if pos < 0:
+            continue
+        try:
+            record, _ = decoder.raw_decode(line, pos + len(TRACE_MARKER) - 1)
+        except ValueError:
+            continue
+        if isinstance(record, dict) and "trace_id" in record and "stage" in record and "ts" in record:
+            yield record
+
+
+class Trace:
+    """
+    The stages one traced transaction reached, short `Trace`.
+    """
+
+    def __init__(self):
+        """Initializes the trace, no stage is reached yet."""
+        self.stages = {}
+        self.deliveries = 0
+        self.valid = False
+
+    def add(self, record):
+        """
+        Add a trace record, only the first time of each stage is kept.
+
+        Arguments:
+            record: The trace record.
+        Returns:
+            -
+        """
+        stage, ts = record["stage"], record["ts"]
+        if stage == STAGE_APPLY_START and record.get("submitted") is not None:
+            # The submit time stamped into the payload, used if the
+            # client side records aren't collected
+            self._first(STAGE_SUBMIT, record["submitted"] / 1000)
+        elif stage == STAGE_APPLY_END:
+            if not record.get("valid"):
+                return
+            self.valid = True
+        elif stage == STAGE_WEB_DELIVERED:
+            self.deliveries += 1
+        self._first(stage, ts)
+
+    def _first(self, stage, ts):
+        if stage not in self.stages or ts < self.stages[stage]:
+            self.stages[stage] = ts
+
+    def latency(self, start, end):
+        """
+        Returns the latency between two stages in milliseconds,
+        or None if one of them wasn't reached.
+        """
+        if start not in self.stages or end not in self.stages:
+            return None
+        return 1000 * (self.stages[end] - self.stages[start])
+
+
+def collect(files):
+    """
+    Joins the trace records of all `files` by trace id.
+
+    Arguments:
+        files: The paths of the logs, `-` is stdin.
+    Returns:
+        A dictionary of trace ids mapped to `Trace` instances.
+    """
+    traces = {}
+    for path in files:
+        f = sys.stdin if path == "-" else open(path, errors="replace")
+        try:
+            for record in read_records(f):
+                traces.setdefault(record["trace_id"], Trace()).add(record)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+    return traces
+
+
+def percentile(values, p):
+    """
+    Returns the `p`th percentile of sorted `values`, nearest rank.
+    """
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+def histogram(name, values):
+    """
+    Formats the latencies of a segment as a histogram.
+
+    Arguments:
+        name: The name of the segment.
+        values: The latencies in milliseconds.
+    Returns:
+        The histogram as a printable string.
+    """
+    if not values:
+        return "{}: no traces".format(name)
+    values = sorted(values)
+    lines = ["{}: {} traces, p50={:.1f}ms p90={:.1f}ms p99={:.1f}ms max={:.1f}ms".format(
+        name, len(values), percentile(values, 50), percentile(values, 90),
+        percentile(values, 99), values[-1]
+    )]
+    counts = [0] * (len(BUCKETS) + 1)
+    for value in values:
+        i = 0
+        while i < len(BUCKETS) and value > BUCKETS[i]:
+            i += 1
+        counts[i] += 1
+    # Skip the empty buckets below the smallest and above the largest value
+    used = [i for i, count in enumerate(counts) if count]
+    for i in range(used[0], used[-1] + 1):
+        label = "<= {}ms".format(BUCKETS[i]) if i < len(BUCKETS) \
+            else "> {}ms".format(BUCKETS[-1])
+        lines.append("  {:>10} {:>7} {}".format(
+            label, counts[i], "#" * int(round(BAR_WIDTH * counts[i] / max(counts)))
+        ).rstrip())
+    return "\n".join(lines)
+
+
+def report(traces):
+    """
+    Formats the per-segment latency histograms of `traces`.
+
+    Arguments:
+        traces: The dictionary returned by `collect`.
+    Returns:
+        The report as a printable string.
+    """
+    valid = [t for t in traces.values() if t.valid]
+    delivered = [t for t in valid if t.deliveries]
+    parts = ["{} traces, {} applied valid, {} delivered to {} WebSocket clients".format(
+        len(traces), len(valid), len(delivered),
+        sum(t.deliveries for t in delivered)
+    )]
+    for name, start, end in SEGMENTS:
+        values = [t.latency(start, end) for t in valid]
+        parts.append(histogram(name, [v for v in values if v is not None]))
+    return "\n\n".join(parts)
+
+
+def _check():
+    """
+    Checks that the records of sample log lines are read.
+
+    Returns:
+        True if all records were read.
+    """
+    records = list(read_records(_CHECK_LINES))
+    ok = [r["stage"] for r in records] == ["apply_start", "web_delivered", "submit"]
+    print("Read {} of {} sample records: {}".format(
+        len(records), len(_CHECK_LINES), "OK" if ok else "FAILED"
+    ))
+    return ok
+
+
+if __name__ == "__main__":
+    # Declare the arguments
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=APP_NAME
+    )
+    parser.add_argument(
+        "files",
+        nargs="*",
+        help="The trace file and logs to collect trace records from, - is stdin",
+    )
+    parser.add_argument(
+        "--check",
+        dest="check",
+        action="store_true",
+        help="Check that the records of sample log lines are read and exit",
+    )
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if _check() else 1)
+    if not args.files:
+        parser.error("No files given")
+    print(report(collect(args.files)))
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3.5
+# encoding: utf-8
+
+import logging
+import time
+
+from collections import OrderedDict
+
+import requests
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+# The Sawtooth REST API endpoint which we're going to use
+REST_API_ENDPOINT_BATCH_STATUSES = "/batch_statuses"
+
+# The batch statuses reported by the REST API
+STATUS_COMMITTED = "COMMITTED"
+STATUS_INVALID = "INVALID"
+STATUS_PENDING = "PENDING"
+STATUS_UNKNOWN = "UNKNOWN"
+
+# The maximum number of batch ids queried in one request
+MAX_IDS_PER_REQUEST = 1000
+
+# How long the REST API waits in seconds for the oldest batches to
+# change their status, and the timeout of a request on top of that
+STATUS_WAIT = 1
+TIMEOUT = 10
+
+# How long in seconds after it was added a batch may be unknown to the
+# validator before it's considered dropped
+UNKNOWN_GRACE = 10
+
+
+class BatchTracker:
+    """
+    Tracks the status of many outstanding batches.
+    Pending batch ids are queried in bulk with `POST /batch_statuses`,
+    up to `MAX_IDS_PER_REQUEST` per request. Only the request for the
+    oldest batches waits for a status change, as batches mostly commit
+    in the order they were submitted. A batch is forgotten once it's
+    committed or invalid, or if the validator still doesn't know it
+    `unknown_grace` seconds after it was added, i.e. it was dropped.
+    So memory is constant per pending batch: its id, when it was added
+    and an optional tag given by the caller.
+
+    Arguments:
+        url: The base URL of the REST API.
+        on_committed: Called with the batch id and tag of committed batches.
+        on_invalid: Called with the batch id, tag and the error messages
+            of invalid batches.
+        wait: How long the REST API waits in seconds for a status change.
+        on_unknown: Called with the batch id and tag of dropped batches.
+        unknown_grace: How long in seconds a batch may be unknown.
+    """
+
+    def __init__(self, url, on_committed=None, on_invalid=None, wait=STATUS_WAIT,
+                 on_unknown=None, unknown_grace=UNKNOWN_GRACE):
+        """Initializes the tracker, no batch is tracked."""
+        self._url = url + REST_API_ENDPOINT_BATCH_STATUSES
+        self._session = requests.Session()
+        self._on_committed = on_committed
+        self._on_invalid = on_invalid
+        self._on_unknown = on_unknown
+        self._wait = wait
+        self._unknown_grace = unknown_grace
+        # Batch ids mapped to their tags and when they were added, oldest first
+        self._pending = OrderedDict()
+        self.committed = 0
+        self.invalid = 0
+        self.unknown = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def add(self, batch_id, tag=None):
+        """
+        Start tracking a batch.
+
+        Arguments:
+            batch_id: The id of the batch.
+            tag: Anything the caller wants to get back with the status.
+        Returns:
+            -
+        """
+        self._pending[batch_id] = (tag, time.time())
+
+    def remove(self, batch_id):
+        """
+        Stop tracking a batch without counting it.
+
+        Arguments:
+            batch_id: The id of the batch.
+        Returns:
+            -
+        """
+        self._pending.pop(batch_id, None)
+
+    def _query(self, batch_ids, wait):
+        r = self._session.post(
+            self._url, json=batch_ids,
+            params={"wait": self._wait} if wait else None,
+            timeout=TIMEOUT + self._wait
+        )
+        r.raise_for_status()
+        return r.json().get("data", [])
+
+    def poll(self):
+        """
+        Query the status of all pending batches once.
+
+        Returns:
+            A list of tuples of batch id, status, tag and the error messages
+            for every batch which was committed, found invalid or dropped.
+        """
+        settled = []
+        now = time.time()
+        batch_ids = list(self._pending)
+        for i in range(0, len(batch_ids), MAX_IDS_PER_REQUEST):
+            for status in self._query(batch_ids[i:i + MAX_IDS_PER_REQUEST], i == 0):
+                batch_id = status["id"]
+                if batch_id not in self._pending:
+                    continue
+                if status["status"] == STATUS_COMMITTED:
+                    tag, _ = self._pending.pop(batch_id)
+                    self.committed += 1
+                    settled.append((batch_id, STATUS_COMMITTED, tag, []))
+                    if self._on_committed is not None:
+                        self._on_committed(batch_id, tag)
+                elif status["status"] == STATUS_INVALID:
+                    tag, _ = self._pending.pop(batch_id)
+                    messages = [
+                        txn.get("message", "")
+                        for txn in status.get("invalid_transactions", [])
+                    ]
+                    self.invalid += 1
+                    settled.append((batch_id, STATUS_INVALID, tag, messages))
+                    if self._on_invalid is not None:
+                        self._on_invalid(batch_id, tag, messages)
+                elif status["status"] == STATUS_UNKNOWN and \
+                        now - self._pending[batch_id][1] >= self._unknown_grace:
+                    tag, _ = self._pending.pop(batch_id)
+                    self.unknown += 1
+                    settled.append((batch_id, STATUS_UNKNOWN, tag, []))
+                    if self._on_unknown is not None:
+                        self._on_unknown(batch_id, tag)
+        LOGGER.debug("Batches: {} pending, {} committed, {} invalid, {} unknown".format(
+            self.pending, self.committed, self.invalid, self.unknown
+        ))
+        return settled
+
+    def settled(self, timeout=None):
+        """
+        Poll until no batch is pending or `timeout` expired.
+
+        Arguments:
+            timeout: The maximum number of seconds to poll, forever if None.
+        Returns:
+            A generator of the tuples returned by `poll`.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while self._pending and (deadline is None or time.time() < deadline):
+            for entry in self.poll():
+                yield entry
+
+    def wait(self, timeout=None):
+        """
+        Poll until no batch is pending or `timeout` expired.
+
+        Arguments:
+            timeout: The maximum number of seconds to poll, forever if None.
+        Returns:
+            The number of batches still pending.
+        """
+        for _ in self.settled(timeout):
+            pass
+        return self.pending
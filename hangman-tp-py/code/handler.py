@@ -2,15 +2,20 @@
 # encoding: utf-8
 
 import logging
+import time
 
 from sawtooth_sdk.processor.handler import TransactionHandler
 from sawtooth_sdk.processor.exceptions import InvalidTransaction
 
 from state import (
-    Game, HmState, HM_NAMESPACE,
-    GAME_STATE_ONGOING, GAME_STATE_WON, GAME_STATE_LOST
+    Game, HmState, StateOptions, HM_NAMESPACE,
+    GAME_STATE_ONGOING, GAME_STATE_WON, GAME_STATE_LOST, _make_hm_address
 )
 from payload import HmPayload
+from profiling import (
+    PhaseTimer, Profiler, PHASE_DECODE,
+    STAGE_APPLY_START, STAGE_APPLY_END, TRACE_EVENT_TYPE, trace
+)
 
 # Set up logging
 LOGGER = logging.getLogger(__name__)
@@ -20,6 +25,21 @@ MAX_GUESSES = 6
 
 
 class HangmanTransactionHandler(TransactionHandler):
+    """
+    The transaction handler of the `hm` transaction family.
+
+    Arguments:
+        state_options: The `StateOptions` used to access state.
+        profiler: The `Profiler` to profile transactions with on request.
+    """
+
+    def __init__(self, state_options=None, profiler=None):
+        """Initializes the handler with `state_options` and `profiler`."""
+        self._state_options = state_options if state_options is not None \
+            else StateOptions()
+        self.profiler = profiler if profiler is not None else Profiler()
+        self.phase_timer = PhaseTimer()
+
     # Disable invalid-overridden-method. The sawtooth-sdk expects these to be
     # properties.
     # pylint: disable=invalid-overridden-method
@@ -36,19 +56,60 @@ class HangmanTransactionHandler(TransactionHandler):
         return [HM_NAMESPACE]
 
     def apply(self, transaction, context):
+        return self.profiler.run(self._timed_apply, transaction, context)
+
+    def _timed_apply(self, transaction, context):
+        timing = self.phase_timer.start()
+        try:
+            start = time.perf_counter()
+            hm_payload = HmPayload.from_bytes(transaction.payload)
+            timing.add(PHASE_DECODE, time.perf_counter() - start)
+            if hm_payload.trace_id is None:
+                self._apply(transaction, hm_payload, context, timing)
+            else:
+                self._traced_apply(transaction, hm_payload, context, timing)
+        finally:
+            self.phase_timer.finish(timing)
+
+    def _traced_apply(self, transaction, hm_payload, context, timing):
+        """
+        Apply a transaction the client asked to trace. The start and end of
+        the apply are logged, and if it's valid an event is emitted which
+        the web service uses to record when the game update reaches clients.
+        A transaction may be applied more than once, e.g. for several
+        candidate blocks, each apply is logged.
+        """
+        trace(hm_payload.trace_id, STAGE_APPLY_START, submitted=hm_payload.trace_ts)
+        valid = False
+        try:
+            self._apply(transaction, hm_payload, context, timing)
+            valid = True
+        finally:
+            trace(hm_payload.trace_id, STAGE_APPLY_END, valid=valid)
+        address = _make_hm_address(hm_payload.name, hm_payload.host)
+        HmState(context, self._state_options, timing).add_event(
+            TRACE_EVENT_TYPE,
+            [("trace_id", hm_payload.trace_id), ("address", address)],
+            address
+        )
+
+    def _apply(self, transaction, hm_payload, context, timing):
 
         header = transaction.header
 
         signer = header.signer_public_key
 
-        hm_payload = HmPayload.from_bytes(transaction.payload)
+        hm_state = HmState(context, self._state_options, timing)
 
-        hm_state = HmState(context)
+        # The host of the game if address scheme v2 is used
+        host = hm_payload.host
 
         if hm_payload.action == "create":
             # Game creation was requested
             LOGGER.debug("Action: create")
-            game = hm_state.get_game(hm_payload.name)
+            if host is not None and host != signer:
+                raise InvalidTransaction("Games can only be created under the signer's host address")
+            game = hm_state.get_game(hm_payload.name, host)
             if game:
                 raise InvalidTransaction("Game '{}' already exists".format(hm_payload.name))
             game = Game(
@@ -60,13 +121,13 @@ class HangmanTransactionHandler(TransactionHandler):
                 guesser="",
                 state=GAME_STATE_ONGOING
             )
-            hm_state.set_game(hm_payload.name, game)
+            hm_state.set_game(hm_payload.name, game, host)
             LOGGER.info("Player '{}' created game '{}'".format(signer, hm_payload.name))
         elif hm_payload.action == "delete":
             # Game deletion was requested
             LOGGER.debug("Action: delete")
             try:
-                hm_state.delete_game(hm_payload.name)
+                hm_state.delete_game(hm_payload.name, host)
                 LOGGER.info("Player '{}' deleted game '{}'".format(signer, hm_payload.name))
             except KeyError:
                 raise InvalidTransaction("Game '{}' doesn't exist".format(hm_payload.name))
@@ -75,7 +136,7 @@ class HangmanTransactionHandler(TransactionHandler):
             LOGGER.debug("Action: guess")
             guess = hm_payload.guess.lower()
             # Game doesn't exist
-            game = hm_state.get_game(hm_payload.name)
+            game = hm_state.get_game(hm_payload.name, host)
             if not game:
                 raise InvalidTransaction("Game '{}' doesn't exists".format(hm_payload.name))
             # Game has ended
@@ -97,17 +158,21 @@ class HangmanTransactionHandler(TransactionHandler):
                 new_state = GAME_STATE_LOST
             else:
                 new_state = GAME_STATE_ONGOING
+            # Record when the game ended so it can be pruned later
+            ended_at = hm_state.get_block_number() \
+                if new_state != GAME_STATE_ONGOING else None
             new_game = Game(
                 name=game.name,
                 word=game.word,
                 misses=new_misses,
                 hits=new_hits,
                 host=game.host,
-                guesser=game.guesser,
-                state=new_state
+                guesser=signer,
+                state=new_state,
+                ended_at=ended_at
             )
             LOGGER.debug("New game computation completed")
-            hm_state.set_game(hm_payload.name, new_game)
+            hm_state.set_game(hm_payload.name, new_game, host)
             LOGGER.info("""Game stats:
                 Name: '{}'
                 Word: '{}'
@@ -116,6 +181,44 @@ class HangmanTransactionHandler(TransactionHandler):
                 Host: '{}'
                 Guesser: '{}'
                 State: '{}'
-                """.format(game.name, game.word, new_misses, new_hits, game.host, game.guesser, new_state))
+                """.format(game.name, game.word, new_misses, new_hits, game.host, signer, new_state))
+        elif hm_payload.action == "prune":
+            # Anyone can prune a game which ended long enough ago
+            LOGGER.debug("Action: prune")
+            game = hm_state.get_game(hm_payload.name, host)
+            if not game:
+                raise InvalidTransaction("Game '{}' doesn't exist".format(hm_payload.name))
+            if game.state == GAME_STATE_ONGOING:
+                raise InvalidTransaction("Game '{}' hasn't ended yet".format(hm_payload.name))
+            block_number = hm_state.get_block_number()
+            if block_number is None:
+                raise InvalidTransaction("No block info available")
+            if game.ended_at is None:
+                # The game ended before end blocks were recorded or while no
+                # block info was available, so record the current block as
+                # its end, it can be pruned once the retention has passed
+                game.ended_at = block_number
+                hm_state.set_game(hm_payload.name, game, host)
+                LOGGER.info("Player '{}' recorded the end of game '{}' at block {}".format(
+                    signer, hm_payload.name, block_number))
+            else:
+                prunable_at = game.ended_at + hm_state.get_retention_blocks()
+                if block_number < prunable_at:
+                    raise InvalidTransaction("Game '{}' can't be pruned before block {}".format(
+                        hm_payload.name, prunable_at))
+                hm_state.delete_game(hm_payload.name, host)
+                LOGGER.info("Player '{}' pruned game '{}'".format(signer, hm_payload.name))
+        elif hm_payload.action == "migrate":
+            # The host moves a game to address scheme v2
+            LOGGER.debug("Action: migrate")
+            game = hm_state.get_game(hm_payload.name)
+            if not game:
+                raise InvalidTransaction("Game '{}' doesn't exist".format(hm_payload.name))
+            if game.host != signer or host != signer:
+                raise InvalidTransaction("Only the host can migrate game '{}'".format(hm_payload.name))
+            if hm_state.get_game(hm_payload.name, host):
+                raise InvalidTransaction("Game '{}' already exists at the host address".format(hm_payload.name))
+            hm_state.migrate_game(hm_payload.name, host)
+            LOGGER.info("Player '{}' migrated game '{}'".format(signer, hm_payload.name))
         else:
             raise InvalidTransaction("Unknown action '{}'".format(hm_payload.action))
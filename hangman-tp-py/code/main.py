@@ -3,14 +3,22 @@
 
 import logging
 import argparse
+import signal
 
 from colorlog import ColoredFormatter
 from sawtooth_sdk.processor.core import TransactionProcessor
 
 from handler import HangmanTransactionHandler
+from profiling import Profiler, PROFILE_TRANSACTIONS, PROFILE_SECONDS
+from state import (
+    StateOptions, GET_TIMEOUT, SET_TIMEOUT, DELETE_TIMEOUT,
+    GET_RETRIES, RETRY_DELAY, SLOW_CALL_THRESHOLD, slow_calls_summary
+)
 
 APP_NAME = "Hangman Transaction Processor"
 
+LOGGER = logging.getLogger(__name__)
+
 
 def create_console_handler(log_level):
     """
@@ -54,6 +62,26 @@ def init_logging(log_level=logging.DEBUG):
     logger.addHandler(create_console_handler(log_level))
 
 
+def init_signals(handler):
+    """
+    Set up the signals to inspect a running transaction processor:
+    - `SIGUSR1` starts profiling the next transactions
+    - `SIGUSR2` logs the average time per transaction phase
+      and the most recent slow state calls
+
+    Arguments:
+        handler: The `HangmanTransactionHandler` to inspect.
+    Returns:
+        -
+    """
+    signal.signal(signal.SIGUSR1, lambda signum, frame: handler.profiler.request())
+    signal.signal(signal.SIGUSR2, lambda signum, frame: LOGGER.info(
+        "Transaction phases: {}\n{}".format(
+            handler.phase_timer.summary(), slow_calls_summary()
+        )
+    ))
+
+
 if __name__ == "__main__":
     # Declare the arguments
     parser = argparse.ArgumentParser(
@@ -66,6 +94,68 @@ if __name__ == "__main__":
         default="tcp://127.0.0.1:4004",
         help="The validator to connect to",
     )
+    parser.add_argument(
+        "--get-timeout",
+        dest="get_timeout",
+        type=float,
+        default=GET_TIMEOUT,
+        help="The timeout in seconds for reading state",
+    )
+    parser.add_argument(
+        "--set-timeout",
+        dest="set_timeout",
+        type=float,
+        default=SET_TIMEOUT,
+        help="The timeout in seconds for writing state",
+    )
+    parser.add_argument(
+        "--delete-timeout",
+        dest="delete_timeout",
+        type=float,
+        default=DELETE_TIMEOUT,
+        help="The timeout in seconds for deleting state",
+    )
+    parser.add_argument(
+        "--get-retries",
+        dest="get_retries",
+        type=int,
+        default=GET_RETRIES,
+        help="How often a timed out read is retried",
+    )
+    parser.add_argument(
+        "--retry-delay",
+        dest="retry_delay",
+        type=float,
+        default=RETRY_DELAY,
+        help="The base delay in seconds between retries",
+    )
+    parser.add_argument(
+        "--slow-call-threshold",
+        dest="slow_call_threshold",
+        type=float,
+        default=SLOW_CALL_THRESHOLD,
+        help="State calls slower than this many seconds are logged",
+    )
+    parser.add_argument(
+        "--profile-transactions",
+        dest="profile_transactions",
+        type=int,
+        default=PROFILE_TRANSACTIONS,
+        help="The number of transactions to profile after SIGUSR1",
+    )
+    parser.add_argument(
+        "--profile-seconds",
+        dest="profile_seconds",
+        type=float,
+        default=PROFILE_SECONDS,
+        help="The maximum number of seconds to profile after SIGUSR1",
+    )
+    parser.add_argument(
+        "--profile-output",
+        dest="profile_output",
+        default=None,
+        help="The file to write profiles to in pstats format",
+    )
 
     # Parse the arguments
     args = parser.parse_args()
@@ -77,7 +167,19 @@ if __name__ == "__main__":
     processor = None
     try:
         processor = TransactionProcessor(url=args.validator)
-        handler = HangmanTransactionHandler()
+        handler = HangmanTransactionHandler(StateOptions(
+            get_timeout=args.get_timeout,
+            set_timeout=args.set_timeout,
+            delete_timeout=args.delete_timeout,
+            get_retries=args.get_retries,
+            retry_delay=args.retry_delay,
+            slow_call_threshold=args.slow_call_threshold
+        ), Profiler(
+            transactions=args.profile_transactions,
+            seconds=args.profile_seconds,
+            output=args.profile_output
+        ))
+        init_signals(handler)
         processor.add_handler(handler)
         processor.start()
     except KeyboardInterrupt:
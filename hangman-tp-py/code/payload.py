@@ -2,20 +2,169 @@
 # encoding: utf-8
 
 import logging
+import struct
 
-from cbor2 import loads
 from sawtooth_sdk.processor.exceptions import InvalidTransaction
 
 # Set up logging
 LOGGER = logging.getLogger(__name__)
 
+# The actions a payload can request
+ACTIONS = ["create", "delete", "guess", "prune", "migrate"]
+
+# Limits of a payload, lengths are in UTF-8 encoded bytes
+MAX_PAYLOAD_BYTES = 512
+MAX_NAME_LENGTH = 128
+MAX_WORD_LENGTH = 64
+MAX_ACTION_LENGTH = 16
+MAX_HOST_LENGTH = 130
+MAX_TRACE_ID_LENGTH = 32
+
+# The text fields of a payload and the maximum length of their values
+FIELDS = {
+    "name": MAX_NAME_LENGTH,
+    "action": MAX_ACTION_LENGTH,
+    "guess": MAX_WORD_LENGTH,
+    "host": MAX_HOST_LENGTH,
+    "trace_id": MAX_TRACE_ID_LENGTH,
+}
+
+# The unsigned integer fields of a payload
+UINT_FIELDS = {"trace_ts"}
+MAX_KEY_LENGTH = max(len(key) for key in list(FIELDS) + list(UINT_FIELDS))
+
+# CBOR major types and the sizes of the additional information
+_CBOR_UINT = 0
+_CBOR_TEXT = 3
+_CBOR_MAP = 5
+_CBOR_ARGUMENT_FORMATS = {24: ">B", 25: ">H", 26: ">I", 27: ">Q"}
+
+
+def _read_head(data, pos):
+    """
+    Reads the head of a CBOR item, indefinite lengths are rejected.
+
+    Arguments:
+        data: The CBOR encoded data.
+        pos: The position of the item.
+    Returns:
+        A tuple of major type, argument and the position after the head.
+    Raises:
+        An `InvalidTransaction` if the head is malformed.
+    """
+    if pos >= len(data):
+        raise InvalidTransaction("Truncated payload")
+    major, info = data[pos] >> 5, data[pos] & 0x1f
+    pos += 1
+    if info < 24:
+        return major, info, pos
+    if info not in _CBOR_ARGUMENT_FORMATS:
+        raise InvalidTransaction("Unsupported encoding in payload")
+    fmt = _CBOR_ARGUMENT_FORMATS[info]
+    end = pos + struct.calcsize(fmt)
+    if end > len(data):
+        raise InvalidTransaction("Truncated payload")
+    return major, struct.unpack(fmt, data[pos:end])[0], end
+
+
+def _read_text(data, pos, max_length, what):
+    """
+    Reads a CBOR text string, its length is checked before it's decoded.
+
+    Arguments:
+        data: The CBOR encoded data.
+        pos: The position of the text string.
+        max_length: The maximum length in UTF-8 encoded bytes.
+        what: What is read, used in error messages.
+    Returns:
+        A tuple of the decoded string and the position after it.
+    Raises:
+        An `InvalidTransaction` if the item isn't a text string
+        of at most `max_length` bytes.
+    """
+    major, length, pos = _read_head(data, pos)
+    if major != _CBOR_TEXT:
+        raise InvalidTransaction("{} must be a string".format(what))
+    if length > max_length:
+        raise InvalidTransaction("{} is too long, maximum is {}".format(
+            what, max_length
+        ))
+    end = pos + length
+    if end > len(data):
+        raise InvalidTransaction("Truncated payload")
+    try:
+        return data[pos:end].decode("utf-8"), end
+    except UnicodeDecodeError:
+        raise InvalidTransaction("{} is not valid UTF-8".format(what))
+
+
+def _read_uint(data, pos, what):
+    """
+    Reads a CBOR unsigned integer.
+
+    Arguments:
+        data: The CBOR encoded data.
+        pos: The position of the integer.
+        what: What is read, used in error messages.
+    Returns:
+        A tuple of the integer and the position after it.
+    Raises:
+        An `InvalidTransaction` if the item isn't an unsigned integer.
+    """
+    major, value, pos = _read_head(data, pos)
+    if major != _CBOR_UINT:
+        raise InvalidTransaction("{} must be an unsigned integer".format(what))
+    return value, pos
+
+
+def decode(payload):
+    """
+    Strictly decodes a CBOR encoded payload.
+    The payload must be a map of at most `FIELDS` with text string values
+    and `UINT_FIELDS` with unsigned integer values.
+    All sizes are checked before anything is decoded, so oversized or
+    malformed input is rejected without allocating large objects.
+
+    Arguments:
+        payload: The CBOR encoded payload.
+    Returns:
+        A dictionary of the decoded fields.
+    Raises:
+        An `InvalidTransaction` if the payload is oversized or malformed.
+    """
+    if len(payload) > MAX_PAYLOAD_BYTES:
+        raise InvalidTransaction("Payload is too large, maximum is {} bytes".format(
+            MAX_PAYLOAD_BYTES
+        ))
+    major, entries, pos = _read_head(payload, 0)
+    if major != _CBOR_MAP:
+        raise InvalidTransaction("Payload must be a map")
+    if entries > len(FIELDS) + len(UINT_FIELDS):
+        raise InvalidTransaction("Payload has too many fields")
+    fields = {}
+    for _ in range(entries):
+        key, pos = _read_text(payload, pos, MAX_KEY_LENGTH, "Field name")
+        if key not in FIELDS and key not in UINT_FIELDS:
+            raise InvalidTransaction("Unknown field '{}'".format(key))
+        if key in fields:
+            raise InvalidTransaction("Duplicate field '{}'".format(key))
+        if key in UINT_FIELDS:
+            fields[key], pos = _read_uint(payload, pos, key.capitalize())
+        else:
+            fields[key], pos = _read_text(
+                payload, pos, FIELDS[key], key.capitalize()
+            )
+    if pos != len(payload):
+        raise InvalidTransaction("Trailing data after payload")
+    return fields
+
 
 class HmPayload:
     """
     A Hangman Payload description, short `HmPayload`.
     Information is sent in Concise Binary Object Representation,
-    see https://en.wikipedia.org/wiki/CBOR, so we use `cbor2`
-    to decode information here.
+    see https://en.wikipedia.org/wiki/CBOR, it's decoded by the
+    strict decoder `decode` here.
 
     Arguments:
         payload: The payload to initialize with.
@@ -23,19 +172,36 @@ class HmPayload:
 
     def __init__(self, payload):
         """Initializes Hangman Payload with `payload`."""
-        payload_de = loads(payload)
-        if "name" not in payload_de:
+        payload_de = decode(payload)
+        if not payload_de.get("name"):
             raise InvalidTransaction("Name is required")
         if "action" not in payload_de:
             raise InvalidTransaction("Action is required")
-        if payload_de["action"] not in ["create", "delete", "guess"]:
+        action = payload_de["action"]
+        if action not in ACTIONS:
             raise InvalidTransaction("Invalid action: '{}'".format(action))
+        guess = payload_de.get("guess", "")
+        if action == "create" and not guess:
+            raise InvalidTransaction("Word is required")
+        if action == "guess" and len(guess) != 1:
+            raise InvalidTransaction("Guess must be exactly one letter")
+        host = payload_de.get("host") or None
+        if host is not None and \
+                not all(c in "0123456789abcdef" for c in host):
+            raise InvalidTransaction("Host must be a hex encoded public key")
+        if action == "migrate" and host is None:
+            raise InvalidTransaction("Host is required")
         self._name = payload_de["name"]
-        self._action = payload_de["action"]
-        self._guess = payload_de["guess"]
-        LOGGER.debug("Name: {}".format(payload_de["name"]))
-        LOGGER.debug("Action: {}".format(payload_de["action"]))
-        LOGGER.debug("Guess: {}".format(payload_de["guess"]))
+        self._action = action
+        self._guess = guess
+        self._host = host
+        # Tracing only, ignored by the game logic
+        self._trace_id = payload_de.get("trace_id") or None
+        self._trace_ts = payload_de.get("trace_ts")
+        LOGGER.debug("Name: {}".format(self._name))
+        LOGGER.debug("Action: {}".format(self._action))
+        LOGGER.debug("Guess: {}".format(self._guess))
+        LOGGER.debug("Host: {}".format(self._host))
 
     @staticmethod
     def from_bytes(payload):
@@ -52,3 +218,100 @@ class HmPayload:
     @property
     def guess(self):
         return self._guess
+
+    @property
+    def host(self):
+        """The host for address scheme v2, None for scheme v1."""
+        return self._host
+
+    @property
+    def trace_id(self):
+        """The trace id set by the client, None if not traced."""
+        return self._trace_id
+
+    @property
+    def trace_ts(self):
+        """The time the client created the payload in ms, None if not traced."""
+        return self._trace_ts
+
+
+def _fuzz(iterations=100000, seed=0):
+    """
+    Feeds mutated and random payloads to `HmPayload` and checks that
+    nothing but `InvalidTransaction` is ever raised.
+
+    Arguments:
+        iterations: The number of payloads to try.
+        seed: The seed of the random generator.
+    Returns:
+        -
+    """
+    import random
+    from cbor2 import dumps
+
+    rand = random.Random(seed)
+    valid = [
+        dumps({"name": "Game of Words", "action": "create", "guess": "Weatherman"}),
+        dumps({"name": "Game of Words", "action": "guess", "guess": "e"}),
+        dumps({"name": "Game of Words", "action": "delete", "guess": ""}),
+        dumps({"name": "Game of Words", "action": "guess", "guess": "e",
+               "trace_id": 32 * "a", "trace_ts": 1600000000000}),
+    ]
+    accepted = 0
+    for _ in range(iterations):
+        payload = bytearray(rand.choice(valid))
+        for _ in range(rand.randint(1, 4)):
+            if not payload:
+                break
+            mutation = rand.randrange(3)
+            pos = rand.randrange(len(payload))
+            if mutation == 0:
+                payload[pos] = rand.randrange(256)
+            elif mutation == 1:
+                del payload[pos:pos + rand.randint(1, 8)]
+            else:
+                payload[pos:pos] = bytes(rand.randrange(256) for _ in range(rand.randint(1, 8)))
+        if rand.random() < 0.05:
+            payload = bytearray(rand.randrange(256) for _ in range(rand.randint(0, 1024)))
+        try:
+            HmPayload.from_bytes(bytes(payload))
+            accepted += 1
+        except InvalidTransaction:
+            pass
+    print("Fuzzed {} payloads, {} accepted".format(iterations, accepted))
+
+
+def _benchmark(iterations=100000):
+    """
+    Measures the decode throughput of valid and oversized payloads.
+
+    Arguments:
+        iterations: The number of payloads to decode.
+    Returns:
+        -
+    """
+    import time
+    from cbor2 import dumps
+
+    payloads = [
+        ("valid", dumps({"name": "Game of Words", "action": "guess", "guess": "e"})),
+        ("oversized", dumps({"name": "Game of Words", "action": "create", "guess": 100000 * "a"})),
+        ("long word", dumps({"name": "Game of Words", "action": "create", "guess": 400 * "a"})),
+    ]
+    for label, payload in payloads:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            try:
+                HmPayload.from_bytes(payload)
+            except InvalidTransaction:
+                pass
+        elapsed = time.perf_counter() - start
+        print("{:10s} {:7d} bytes: {:.0f} payloads/s".format(
+            label, len(payload), iterations / elapsed
+        ))
+
+
+if __name__ == "__main__":
+    logging.disable(logging.CRITICAL)
+    _fuzz()
+    _benchmark()
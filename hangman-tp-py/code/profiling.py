@@ -0,0 +1,255 @@
+#!/usr/bin/env python3.5
+# encoding: utf-8
+
+import cProfile
+import io
+import json
+import logging
+import pstats
+import threading
+import time
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+# The phases of a transaction, `compute` is whatever isn't one of the others
+PHASE_DECODE = "decode"
+PHASE_READ = "read"
+PHASE_COMPUTE = "compute"
+PHASE_WRITE = "write"
+PHASES = (PHASE_DECODE, PHASE_READ, PHASE_COMPUTE, PHASE_WRITE)
+
+# Defaults for how long to profile once profiling is requested
+PROFILE_TRANSACTIONS = 100
+PROFILE_SECONDS = 60
+
+# Only functions of these modules are included in the profile report
+PROFILE_RESTRICTIONS = "handler|state|payload"
+
+# Trace records are logged as this marker followed by a JSON object,
+# see `hmtrace.py` of `hangman-cli-py` which collects them
+TRACE_MARKER = "TRACE"
+
+# The stages of a traced transaction recorded by the transaction processor
+STAGE_APPLY_START = "apply_start"
+STAGE_APPLY_END = "apply_end"
+
+# The event emitted for traced transactions, it carries the trace id
+# and the address of the game so the web service can match it to the
+# state delta of the same block
+TRACE_EVENT_TYPE = "hm/trace"
+
+
+def trace(trace_id, stage, **fields):
+    """
+    Log a trace record, stamped with the current time.
+
+    Arguments:
+        trace_id: The trace id of the transaction.
+        stage: The stage reached, e.g. `STAGE_APPLY_START`.
+        fields: Further fields of the record.
+    Returns:
+        -
+    """
+    record = dict(fields, trace_id=trace_id, stage=stage, ts=time.time())
+    LOGGER.info("{} {}".format(TRACE_MARKER, json.dumps(record, sort_keys=True)))
+
+
+class TransactionTiming:
+    """
+    The time spent in each phase of one transaction, short `TransactionTiming`.
+    """
+
+    def __init__(self):
+        """Initializes all phases with zero and starts the clock."""
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self._start = time.perf_counter()
+        self.total = None
+
+    def add(self, phase, elapsed):
+        """
+        Add time spent in a phase.
+
+        Arguments:
+            phase: The phase, see `PHASES`.
+            elapsed: The time spent in seconds.
+        Returns:
+            -
+        """
+        self.phases[phase] += elapsed
+
+    def stop(self):
+        """
+        Stop the clock, the time not spent in any
+        other phase is accounted to `PHASE_COMPUTE`.
+        """
+        self.total = time.perf_counter() - self._start
+        other = sum(self.phases.values()) - self.phases[PHASE_COMPUTE]
+        self.phases[PHASE_COMPUTE] = max(self.total - other, 0.0)
+
+    def __str__(self):
+        return " ".join(
+            "{}={:.2f}ms".format(phase, 1000 * self.phases[phase])
+            for phase in PHASES
+        ) + " total={:.2f}ms".format(1000 * (self.total or 0.0))
+
+
+class PhaseTimer:
+    """
+    An always-on, lightweight timer which breaks transactions
+    down into the phases decode, read, compute and write,
+    and keeps totals over all transactions.
+    """
+
+    def __init__(self):
+        """Initializes the totals with zero."""
+        # Reentrant as `summary` may be called by a signal handler
+        self._lock = threading.RLock()
+        self.count = 0
+        self.totals = dict.fromkeys(PHASES, 0.0)
+
+    def start(self):
+        """
+        Start timing a transaction.
+
+        Returns:
+            A new `TransactionTiming`.
+        """
+        return TransactionTiming()
+
+    def finish(self, timing):
+        """
+        Stop timing a transaction and add it to the totals.
+
+        Arguments:
+            timing: The `TransactionTiming` returned by `start`.
+        Returns:
+            -
+        """
+        timing.stop()
+        with self._lock:
+            self.count += 1
+            for phase in PHASES:
+                self.totals[phase] += timing.phases[phase]
+        LOGGER.debug("Transaction phases: {}".format(timing))
+
+    def summary(self):
+        """
+        Returns the average time per phase as a printable string.
+        """
+        with self._lock:
+            count, totals = self.count, dict(self.totals)
+        if count == 0:
+            return "No transactions timed yet"
+        return "{} transactions, average ".format(count) + " ".join(
+            "{}={:.2f}ms".format(phase, 1000 * totals[phase] / count)
+            for phase in PHASES
+        )
+
+
+class Profiler:
+    """
+    Profiles transactions with `cProfile` on request, e.g. from a signal
+    handler. Once requested the next `transactions` transactions, or all
+    transactions within `seconds`, whatever comes first, are profiled and
+    the per-function stats are logged and optionally written to `output`.
+
+    Arguments:
+        transactions: The number of transactions to profile.
+        seconds: The maximum number of seconds to profile.
+        output: The file to write the stats to in `pstats` format, or None.
+    """
+
+    def __init__(self, transactions=PROFILE_TRANSACTIONS,
+                 seconds=PROFILE_SECONDS, output=None):
+        """Initializes the profiler, it starts disabled."""
+        self._transactions = transactions
+        self._seconds = seconds
+        self._output = output
+        # Reentrant as `request` may be called by a signal handler
+        # interrupting the same thread while it holds the lock
+        self._lock = threading.RLock()
+        self._active = False
+        self._stats = None
+        self._count = 0
+        self._timer = None
+
+    @property
+    def active(self):
+        return self._active
+
+    def request(self):
+        """
+        Start profiling, does nothing if profiling is active already.
+        Safe to call from a signal handler.
+        """
+        with self._lock:
+            if self._active:
+                return
+            self._active = True
+            self._stats = None
+            self._count = 0
+            self._timer = threading.Timer(self._seconds, self.finish)
+            self._timer.daemon = True
+            self._timer.start()
+        LOGGER.info("Profiling the next {} transactions or {}s".format(
+            self._transactions, self._seconds
+        ))
+
+    def run(self, func, *args):
+        """
+        Call `func` with `args`, profiled if profiling is active.
+
+        Arguments:
+            func: The function to call.
+            args: The arguments to call `func` with.
+        Returns:
+            The result of `func`.
+        """
+        if not self._active:
+            return func(*args)
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            return func(*args)
+        finally:
+            profile.disable()
+            self._add(profile)
+
+    def _add(self, profile):
+        with self._lock:
+            if not self._active:
+                return
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self._count += 1
+            done = self._count >= self._transactions
+        if done:
+            self.finish()
+
+    def finish(self):
+        """
+        Stop profiling and report the stats collected so far.
+        """
+        with self._lock:
+            if not self._active:
+                return
+            self._active = False
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            stats, count = self._stats, self._count
+        if stats is None:
+            LOGGER.info("Profiling finished, no transactions were profiled")
+            return
+        report = io.StringIO()
+        stats.stream = report
+        stats.sort_stats("cumulative").print_stats(PROFILE_RESTRICTIONS)
+        LOGGER.info("Profile of {} transactions:\n{}".format(
+            count, report.getvalue()
+        ))
+        if self._output is not None:
+            stats.dump_stats(self._output)
+            LOGGER.info("Profile written to '{}'".format(self._output))
@@ -0,0 +1,632 @@
+#!/usr/bin/env python3.5
+# encoding: utf-8
+
+"""
+Replays the `hm` transactions of a chain offline.
+
+Blocks are read from the Sawtooth REST API or from a file exported by this
+tool, their `hm` transactions are fed through `HangmanTransactionHandler.apply`
+against a local state store instead of a validator. This allows to rebuild
+and verify the Hangman state and to benchmark the handler on real traffic.
+
+The injected `block_info` transactions are replayed as well, as far as the
+`BlockInfoConfig` read by the handler is concerned, so games end at the
+same block numbers as on chain. Settings aren't replayed, the retention
+setting is copied from the chain once when replaying from the REST API.
+
+Only state values are compared with the chain, computing state roots would
+require the validator's Merkle-Radix tree implementation.
+"""
+
+import argparse
+import base64
+import json
+import logging
+import sqlite3
+import sys
+import time
+
+import requests
+from google.protobuf.json_format import ParseDict
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+from sawtooth_sdk.protobuf.block_info_pb2 import BlockInfoConfig, BlockInfoTxn
+from sawtooth_sdk.protobuf.processor_pb2 import TpProcessRequest
+from sawtooth_sdk.protobuf.state_context_pb2 import TpStateEntry
+from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
+
+from handler import HangmanTransactionHandler
+from main import init_logging
+from state import (
+    HM_NAMESPACE, BLOCK_INFO_CONFIG_ADDRESS, SETTING_RETENTION_BLOCKS,
+    _make_settings_address
+)
+
+APP_NAME = "Hangman Replay"
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+# Sawtooth REST API endpoints which we're going to use
+REST_API_URL = "http://rest-api:8008"
+REST_API_ENDPOINT_BLOCKS = "/blocks?limit={}&reverse=true"
+REST_API_PAGING_START = "&start=0x{:016x}"
+REST_API_ENDPOINT_STATE = "/state/{}"
+REST_API_ENDPOINT_STATE_PREFIX = "/state?address={}&head={}"
+BLOCKS_PER_REQUEST = 100
+TIMEOUT = 10
+
+# The transaction families which are replayed
+FAMILY_HM = "hm"
+FAMILY_BLOCK_INFO = "block_info"
+FAMILIES = (FAMILY_HM, FAMILY_BLOCK_INFO)
+
+# The number of blocks after which the replay position is checkpointed
+CHECKPOINT_BLOCKS = 100
+
+
+class DictStore:
+    """
+    A local state store held in memory, short `DictStore`.
+    The replay position is kept as well, but not across runs.
+    """
+
+    def __init__(self):
+        """Initializes an empty store."""
+        self._state = {}
+        self.position = None
+
+    def get(self, address):
+        """
+        Get the data at `address`.
+
+        Arguments:
+            address: The address to read.
+        Returns:
+            The data or None if the address isn't set.
+        """
+        return self._state.get(address)
+
+    def apply(self, changes):
+        """
+        Apply state changes.
+
+        Arguments:
+            changes: A dictionary mapping addresses to data, None deletes.
+        Returns:
+            -
+        """
+        for address, data in changes.items():
+            if data is None:
+                self._state.pop(address, None)
+            else:
+                self._state[address] = data
+
+    def items(self, prefix):
+        """
+        Get all entries below `prefix`.
+
+        Arguments:
+            prefix: The address prefix.
+        Returns:
+            A dictionary mapping addresses to data.
+        """
+        return {
+            address: data for address, data in self._state.items()
+            if address.startswith(prefix)
+        }
+
+    def checkpoint(self, block_num, block_id):
+        """
+        Record that all blocks up to `block_num` have been replayed.
+
+        Arguments:
+            block_num: The number of the last replayed block.
+            block_id: The id of the last replayed block.
+        Returns:
+            -
+        """
+        self.position = (block_num, block_id)
+
+
+class SqliteStore:
+    """
+    A local state store backed by a SQLite database, short `SqliteStore`.
+    State changes only become durable together with a checkpoint, so after
+    an interruption the replay resumes from a consistent position.
+
+    Arguments:
+        path: The path of the database file.
+    """
+
+    def __init__(self, path):
+        """Initializes the store with the database at `path`."""
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS state "
+            "(address TEXT PRIMARY KEY, data BLOB NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS position "
+            "(id INTEGER PRIMARY KEY CHECK (id = 0), "
+            "block_num INTEGER NOT NULL, block_id TEXT NOT NULL)"
+        )
+        self._db.commit()
+        row = self._db.execute(
+            "SELECT block_num, block_id FROM position"
+        ).fetchone()
+        self.position = tuple(row) if row is not None else None
+
+    def get(self, address):
+        """
+        Get the data at `address`.
+
+        Arguments:
+            address: The address to read.
+        Returns:
+            The data or None if the address isn't set.
+        """
+        row = self._db.execute(
+            "SELECT data FROM state WHERE address = ?", (address,)
+        ).fetchone()
+        return bytes(row[0]) if row is not None else None
+
+    def apply(self, changes):
+        """
+        Apply state changes, they're committed with the next checkpoint.
+
+        Arguments:
+            changes: A dictionary mapping addresses to data, None deletes.
+        Returns:
+            -
+        """
+        for address, data in changes.items():
+            if data is None:
+                self._db.execute(
+                    "DELETE FROM state WHERE address = ?", (address,)
+                )
+            else:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO state VALUES (?, ?)",
+                    (address, data)
+                )
+
+    def items(self, prefix):
+        """
+        Get all entries below `prefix`.
+
+        Arguments:
+            prefix: The address prefix.
+        Returns:
+            A dictionary mapping addresses to data.
+        """
+        rows = self._db.execute(
+            "SELECT address, data FROM state WHERE address LIKE ?",
+            (prefix + "%",)
+        )
+        return {address: bytes(data) for address, data in rows}
+
+    def checkpoint(self, block_num, block_id):
+        """
+        Record that all blocks up to `block_num` have been replayed
+        and commit all state changes so far.
+
+        Arguments:
+            block_num: The number of the last replayed block.
+            block_id: The id of the last replayed block.
+        Returns:
+            -
+        """
+        self._db.execute(
+            "INSERT OR REPLACE INTO position VALUES (0, ?, ?)",
+            (block_num, block_id)
+        )
+        self._db.commit()
+        self.position = (block_num, block_id)
+
+
+class ReplayContext:
+    """
+    A local stand-in for the Sawtooth Transaction context, short
+    `ReplayContext`. Writes of a transaction are buffered until it's
+    committed or rolled back, like the validator does.
+
+    Arguments:
+        store: The `DictStore` or `SqliteStore` to read from and commit to.
+    """
+
+    def __init__(self, store):
+        """Initializes the context with `store`."""
+        self._store = store
+        self._pending = {}
+        self.events = []
+
+    def get_state(self, addresses, timeout=None):
+        entries = []
+        for address in addresses:
+            if address in self._pending:
+                data = self._pending[address]
+            else:
+                data = self._store.get(address)
+            if data is not None:
+                entries.append(TpStateEntry(address=address, data=data))
+        return entries
+
+    def set_state(self, entries, timeout=None):
+        self._pending.update(entries)
+        return list(entries)
+
+    def delete_state(self, addresses, timeout=None):
+        deleted = [entry.address for entry in self.get_state(addresses)]
+        for address in deleted:
+            self._pending[address] = None
+        return deleted
+
+    def add_receipt_data(self, data, timeout=None):
+        pass
+
+    def add_event(self, event_type, attributes=None, data=None, timeout=None):
+        self.events.append((event_type, attributes, data))
+
+    def commit(self):
+        """
+        Apply the buffered writes to the store.
+
+        Returns:
+            The addresses changed.
+        """
+        changed = list(self._pending)
+        self._store.apply(self._pending)
+        self.rollback()
+        return changed
+
+    def rollback(self):
+        """Discard the buffered writes and events."""
+        self._pending = {}
+        self.events = []
+
+
+def compact_block(block):
+    """
+    Strip a block as returned by the REST API down to what is replayed.
+
+    Arguments:
+        block: The block dictionary.
+    Returns:
+        A block dictionary with the same layout, but only with the
+        number and id of the block and the replayed transactions.
+    """
+    return {
+        "header_signature": block["header_signature"],
+        "header": {"block_num": block["header"]["block_num"]},
+        "batches": [{
+            "transactions": [
+                txn for batch in block["batches"]
+                for txn in batch["transactions"]
+                if txn["header"]["family_name"] in FAMILIES
+            ]
+        }],
+    }
+
+
+def rest_blocks(url=REST_API_URL, after=None):
+    """
+    Read blocks from the REST API, oldest first.
+    Blocks are paged in reverse, i.e. oldest first, starting at the block
+    after `after`, and returned one page at a time, so replay starts with
+    the first page and memory doesn't grow with the chain.
+
+    Arguments:
+        url: The base URL of the REST API.
+        after: Only blocks with a higher number are returned, all if None.
+    Returns:
+        A generator of compacted block dictionaries.
+    """
+    session = requests.Session()
+    next_url = url + REST_API_ENDPOINT_BLOCKS.format(BLOCKS_PER_REQUEST)
+    if after is not None:
+        next_url += REST_API_PAGING_START.format(after + 1)
+    count = 0
+    while next_url:
+        r = session.get(next_url, timeout=TIMEOUT)
+        r.raise_for_status()
+        ret_json = r.json()
+        for block in ret_json["data"]:
+            if after is not None and int(block["header"]["block_num"]) <= after:
+                continue
+            count += 1
+            yield compact_block(block)
+        next_url = ret_json.get("paging", {}).get("next")
+        LOGGER.info("Read {} blocks".format(count))
+
+
+def file_blocks(path, after=None):
+    """
+    Read blocks from a file with one JSON encoded block per line, oldest
+    first, as written by `--export`.
+
+    Arguments:
+        path: The path of the file.
+        after: Only blocks with a higher number are returned, all if None.
+    Returns:
+        A generator of block dictionaries.
+    """
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            block = json.loads(line)
+            if after is None or int(block["header"]["block_num"]) > after:
+                yield block
+
+
+def transactions(block):
+    """
+    Extract the replayed transactions of a block in order.
+
+    Arguments:
+        block: The block dictionary.
+    Returns:
+        A generator of tuples of family name and `TpProcessRequest`.
+    """
+    for batch in block["batches"]:
+        for txn in batch["transactions"]:
+            family = txn["header"]["family_name"]
+            if family not in FAMILIES:
+                continue
+            yield family, TpProcessRequest(
+                header=ParseDict(
+                    txn["header"], TransactionHeader(),
+                    ignore_unknown_fields=True
+                ),
+                payload=base64.b64decode(txn["payload"]),
+                signature=txn["header_signature"]
+            )
+
+
+def apply_block_info(request, context):
+    """
+    Apply a `block_info` transaction as far as the `BlockInfoConfig`
+    is concerned, which is all the Hangman handler reads.
+
+    Arguments:
+        request: The `TpProcessRequest` of the transaction.
+        context: The `ReplayContext`.
+    Returns:
+        -
+    """
+    txn = BlockInfoTxn()
+    txn.ParseFromString(request.payload)
+    config = BlockInfoConfig()
+    entries = context.get_state([BLOCK_INFO_CONFIG_ADDRESS])
+    if entries:
+        config.ParseFromString(entries[0].data)
+    config.latest_block = txn.block.block_num
+    context.set_state({BLOCK_INFO_CONFIG_ADDRESS: config.SerializeToString()})
+
+
+class ReplayStats:
+    """
+    Counters of a replay, short `ReplayStats`.
+    """
+
+    def __init__(self):
+        """Initializes all counters with zero."""
+        self.blocks = 0
+        self.applied = 0
+        self.invalid = 0
+        self.elapsed = 0.0
+
+    def __str__(self):
+        rate = self.applied / self.elapsed if self.elapsed else 0.0
+        return "{} blocks, {} transactions applied, {} invalid, " \
+            "{:.2f}s in apply, {:.0f} transactions/s".format(
+                self.blocks, self.applied, self.invalid, self.elapsed, rate
+            )
+
+
+def replay(blocks, store, handler, checkpoint_blocks=CHECKPOINT_BLOCKS):
+    """
+    Replay blocks against `store`.
+    Transactions are committed to the store one by one, a checkpoint is
+    made every `checkpoint_blocks` blocks and after the last block.
+
+    Arguments:
+        blocks: The block dictionaries, oldest first.
+        store: The `DictStore` or `SqliteStore` to replay against.
+        handler: The `HangmanTransactionHandler` to apply transactions with.
+        checkpoint_blocks: The number of blocks between checkpoints.
+    Returns:
+        The `ReplayStats`.
+    """
+    stats = ReplayStats()
+    context = ReplayContext(store)
+    last = None
+    for block in blocks:
+        block_num = int(block["header"]["block_num"])
+        for family, request in transactions(block):
+            if family == FAMILY_BLOCK_INFO:
+                apply_block_info(request, context)
+                context.commit()
+                continue
+            start = time.perf_counter()
+            try:
+                handler.apply(request, context)
+            except InvalidTransaction as e:
+                # A committed transaction must be valid, so the replay diverged
+                stats.invalid += 1
+                context.rollback()
+                LOGGER.warning("Transaction {} in block {} is invalid: {}".format(
+                    request.signature, block_num, e
+                ))
+            else:
+                context.commit()
+                stats.applied += 1
+            stats.elapsed += time.perf_counter() - start
+        stats.blocks += 1
+        last = (block_num, block["header_signature"])
+        if stats.blocks % checkpoint_blocks == 0:
+            store.checkpoint(*last)
+            LOGGER.info("Checkpoint at block {}: {}".format(block_num, stats))
+    if last is not None:
+        store.checkpoint(*last)
+    return stats
+
+
+def read_chain_state(url, prefix, head):
+    """
+    Read all state entries below `prefix` from the REST API.
+
+    Arguments:
+        url: The base URL of the REST API.
+        prefix: The address prefix.
+        head: The id of the block to read the state at.
+    Returns:
+        A dictionary mapping addresses to data.
+    """
+    entries = {}
+    session = requests.Session()
+    next_url = url + REST_API_ENDPOINT_STATE_PREFIX.format(prefix, head)
+    while next_url:
+        r = session.get(next_url, timeout=TIMEOUT)
+        r.raise_for_status()
+        ret_json = r.json()
+        for entry in ret_json["data"]:
+            entries[entry["address"]] = base64.b64decode(entry["data"])
+        next_url = ret_json.get("paging", {}).get("next")
+    return entries
+
+
+def seed_settings(url, store):
+    """
+    Copy the retention setting from the chain to `store`,
+    unless it's there already.
+
+    Arguments:
+        url: The base URL of the REST API.
+        store: The `DictStore` or `SqliteStore`.
+    Returns:
+        -
+    """
+    address = _make_settings_address(SETTING_RETENTION_BLOCKS)
+    if store.get(address) is not None:
+        return
+    r = requests.get(
+        url + REST_API_ENDPOINT_STATE.format(address), timeout=TIMEOUT
+    )
+    if r.status_code == 404:
+        return
+    r.raise_for_status()
+    store.apply({address: base64.b64decode(r.json()["data"])})
+
+
+def verify(url, store):
+    """
+    Compare the Hangman state of `store` with the chain
+    at the last replayed block.
+
+    Arguments:
+        url: The base URL of the REST API.
+        store: The `DictStore` or `SqliteStore`.
+    Returns:
+        True if the state matches.
+    """
+    block_num, block_id = store.position
+    local = store.items(HM_NAMESPACE)
+    chain = read_chain_state(url, HM_NAMESPACE, block_id)
+    mismatches = 0
+    for address in sorted(set(local) | set(chain)):
+        if local.get(address) == chain.get(address):
+            continue
+        mismatches += 1
+        if address not in local:
+            LOGGER.warning("Missing locally: {}".format(address))
+        elif address not in chain:
+            LOGGER.warning("Missing on chain: {}".format(address))
+        else:
+            LOGGER.warning("Different value: {}".format(address))
+    LOGGER.warning("Verified {} addresses at block {}, {} mismatches".format(
+        len(chain), block_num, mismatches
+    ))
+    return mismatches == 0
+
+
+if __name__ == "__main__":
+    # Declare the arguments
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=APP_NAME
+    )
+    parser.add_argument(
+        "--url",
+        dest="url",
+        default=REST_API_URL,
+        help="The REST API to read blocks from and verify against",
+    )
+    parser.add_argument(
+        "--file",
+        dest="file",
+        default=None,
+        help="Read blocks from this file instead of the REST API",
+    )
+    parser.add_argument(
+        "--export",
+        dest="export",
+        default=None,
+        help="Export the blocks read from the REST API to this file and exit",
+    )
+    parser.add_argument(
+        "--db",
+        dest="db",
+        default=None,
+        help="Replay against this SQLite database and resume from it, "
+             "in memory if not given",
+    )
+    parser.add_argument(
+        "--checkpoint-blocks",
+        dest="checkpoint_blocks",
+        type=int,
+        default=CHECKPOINT_BLOCKS,
+        help="The number of blocks between checkpoints",
+    )
+    parser.add_argument(
+        "--verify",
+        dest="verify",
+        action="store_true",
+        help="Compare the replayed state with the chain",
+    )
+    parser.add_argument(
+        "--verbose",
+        dest="verbose",
+        action="store_true",
+        help="Log every transaction",
+    )
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    # Set up logging, the handler logs every transaction at info level
+    init_logging(logging.INFO if args.verbose else logging.WARNING)
+
+    if args.export is not None:
+        with open(args.export, "w") as f:
+            for block in rest_blocks(args.url):
+                f.write(json.dumps(block) + "\n")
+        sys.exit(0)
+
+    store = SqliteStore(args.db) if args.db is not None else DictStore()
+    after = store.position[0] if store.position is not None else None
+    if after is not None:
+        LOGGER.warning("Resuming after block {}".format(after))
+    if args.file is not None:
+        blocks = file_blocks(args.file, after)
+    else:
+        seed_settings(args.url, store)
+        blocks = rest_blocks(args.url, after)
+
+    handler = HangmanTransactionHandler()
+    stats = replay(blocks, store, handler, args.checkpoint_blocks)
+    LOGGER.warning("Replayed {}".format(stats))
+    LOGGER.warning("Transaction phases: {}".format(handler.phase_timer.summary()))
+
+    if args.verify and store.position is not None:
+        sys.exit(0 if verify(args.url, store) else 1)
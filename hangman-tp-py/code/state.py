@@ -3,8 +3,19 @@
 
 import logging
 import hashlib
+import random
+import time
+
+from collections import deque
+from functools import partial
 
 from cbor2 import dumps, loads
+from sawtooth_sdk.messaging.future import FutureTimeoutError
+from sawtooth_sdk.protobuf.block_info_pb2 import BlockInfoConfig
+from sawtooth_sdk.protobuf.setting_pb2 import Setting
+from sawtooth_sdk.processor.exceptions import InternalError
+
+from profiling import PHASE_READ, PHASE_WRITE
 
 # Set up logging
 LOGGER = logging.getLogger(__name__)
@@ -12,8 +23,36 @@ LOGGER = logging.getLogger(__name__)
 # The prefix for the Hangman address space, translates to `b89bcb`
 HM_NAMESPACE = hashlib.sha512("hangman".encode("utf-8")).hexdigest()[0:6]
 
-# Timeout used when reading/writing state
-TIMEOUT = 3
+# The number of hash characters of the host in address scheme v2
+HOST_HASH_LENGTH = 8
+
+# The address of the `BlockInfoConfig` of the Block Info transaction family,
+# it holds the number of the latest block
+BLOCK_INFO_CONFIG_ADDRESS = "00b10c01" + "0" * 62
+
+# The setting holding the number of blocks after which finished games can
+# be pruned, and the value used if the setting isn't set
+SETTING_RETENTION_BLOCKS = "sawtooth.hm.retention_blocks"
+RETENTION_BLOCKS = 1000
+
+# The prefix for the Settings address space
+SETTINGS_NAMESPACE = "000000"
+
+# Timeouts in seconds used when reading/writing/deleting state
+GET_TIMEOUT = 3
+SET_TIMEOUT = 3
+DELETE_TIMEOUT = 3
+
+# How often a timed out read is retried and the base delay in seconds
+# between retries, a random jitter of up to the same amount is added
+GET_RETRIES = 2
+RETRY_DELAY = 0.05
+
+# State calls taking longer than this many seconds are recorded as slow
+SLOW_CALL_THRESHOLD = 0.5
+
+# The most recent slow calls, see `HmState._call`
+SLOW_CALLS = deque(maxlen=100)
 
 # Game states, ongoing, won or lost
 # We can't use `Enum` as we can't encode `Enum` with CBOR
@@ -22,7 +61,21 @@ GAME_STATE_WON = 2
 GAME_STATE_LOST = 3
 
 
-def _make_hm_address(name):
+def _make_hm_host_prefix(host):
+    """
+    Creates the prefix of all games hosted by `host` in the
+    Hangman address space (address scheme v2).
+
+    Arguments:
+        host: The public key of the host.
+    Returns:
+        The prefix (`HM_NAMESPACE` + `HM_HOST`, 14 characters long).
+    """
+    return HM_NAMESPACE + \
+        hashlib.sha512(host.encode("utf-8")).hexdigest()[:HOST_HASH_LENGTH]
+
+
+def _make_hm_address(name, host=None):
     """
     Creates an address in the Hangman address space
     in order to store state information.
@@ -32,13 +85,42 @@ def _make_hm_address(name):
     - `HM_GAME`       = `ee7c82d3cdfecf6d65c3c81be0c90e7fa015db96aafbe418e197cad7c52f0c34`
     We return `HM_NAMESPACE` + `HM_GAME` to uniquely identify games in the address space.
 
+    If `host` is given the address scheme v2 is used, the hash of the host
+    comes first so all games of a host share a prefix:
+    - `HM_HOST`       = the first 8 characters of the host's hash
+    - `HM_GAME`       = the first 56 characters of the name's hash
+    We return `HM_NAMESPACE` + `HM_HOST` + `HM_GAME`.
+
     Arguments:
         name: The name of the game.
+        host: The public key of the host for scheme v2, None for scheme v1.
     Returns:
         An address in the Hangman address space (70 characters long).
     """
-    return HM_NAMESPACE + \
-        hashlib.sha512(name.encode("utf-8")).hexdigest()[:64]
+    if host is None:
+        return HM_NAMESPACE + \
+            hashlib.sha512(name.encode("utf-8")).hexdigest()[:64]
+    return _make_hm_host_prefix(host) + \
+        hashlib.sha512(name.encode("utf-8")).hexdigest()[:64 - HOST_HASH_LENGTH]
+
+
+def _make_settings_address(key):
+    """
+    Creates the address of a setting in the Settings address space.
+    The key is split into at most four parts at the dots, each part
+    is hashed and the hashes are concatenated.
+
+    Arguments:
+        key: The key of the setting, e.g. `sawtooth.hm.retention_blocks`.
+    Returns:
+        An address in the Settings address space (70 characters long).
+    """
+    parts = key.split(".", maxsplit=3)
+    parts.extend([""] * (4 - len(parts)))
+    return SETTINGS_NAMESPACE + "".join(
+        hashlib.sha256(part.encode("utf-8")).hexdigest()[:16]
+        for part in parts
+    )
 
 
 class Game:
@@ -56,13 +138,14 @@ class Game:
         host: The host of the game.
         guesser: The guesser.
         state: The state of the game, see `GAME_STATE_*`
+        ended_at: The block number at which the game was won or lost.
     """
 
-    def __init__(self, name="", word="", misses="",
-                 hits="", host="", guesser="", state=GAME_STATE_ONGOING):
+    def __init__(self, name="", word="", misses="", hits="", host="",
+                 guesser="", state=GAME_STATE_ONGOING, ended_at=None):
         """
-        Initializes Game with `name`, `word`,
-        `misses`, `hits`, `host`, `guesser` and `state`.
+        Initializes Game with `name`, `word`, `misses`,
+        `hits`, `host`, `guesser`, `state` and `ended_at`.
         """
         self.name = name
         self.word = word
@@ -71,6 +154,7 @@ class Game:
         self.host = host
         self.guesser = guesser
         self.state = state
+        self.ended_at = ended_at
 
     @classmethod
     def from_dict(cls, d):
@@ -90,7 +174,8 @@ class Game:
             hits=d["hits"],
             host=d["host"],
             guesser=d["guesser"],
-            state=d["state"]
+            state=d["state"],
+            ended_at=d.get("ended_at")
         )
 
     def to_dict(self):
@@ -108,9 +193,53 @@ class Game:
             "host": self.host,
             "guesser": self.guesser,
             "state": self.state,
+            "ended_at": self.ended_at,
         }
 
 
+def slow_calls_summary():
+    """
+    Returns the most recent slow state calls as a printable string,
+    oldest first.
+    """
+    calls = list(SLOW_CALLS)
+    if not calls:
+        return "No slow state calls recorded"
+    return "{} recent slow state calls:\n".format(len(calls)) + "\n".join(
+        "{} {} state call on {}: {:.3f}s".format(
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(call["time"])),
+            call["operation"], call["addresses"], call["elapsed"]
+        )
+        for call in calls
+    )
+
+
+class StateOptions:
+    """
+    Options for accessing state, short `StateOptions`.
+
+    Arguments:
+        get_timeout: The timeout in seconds for reading state.
+        set_timeout: The timeout in seconds for writing state.
+        delete_timeout: The timeout in seconds for deleting state.
+        get_retries: How often a timed out read is retried.
+        retry_delay: The base delay in seconds between retries.
+        slow_call_threshold: Calls slower than this many seconds are recorded.
+    """
+
+    def __init__(self, get_timeout=GET_TIMEOUT, set_timeout=SET_TIMEOUT,
+                 delete_timeout=DELETE_TIMEOUT, get_retries=GET_RETRIES,
+                 retry_delay=RETRY_DELAY,
+                 slow_call_threshold=SLOW_CALL_THRESHOLD):
+        """Initializes the state options."""
+        self.get_timeout = get_timeout
+        self.set_timeout = set_timeout
+        self.delete_timeout = delete_timeout
+        self.get_retries = get_retries
+        self.retry_delay = retry_delay
+        self.slow_call_threshold = slow_call_threshold
+
+
 class HmState:
     """
     A Hangman State description, short `HmState`.
@@ -120,71 +249,262 @@ class HmState:
 
     Arguments:
         context: The Sawtooth Transaction context.
+        options: The `StateOptions` to use, the defaults if None.
+        timing: The `TransactionTiming` to account state calls to, or None.
     """
 
-    def __init__(self, context):
-        """Initializes Hangman State with `context`."""
+    def __init__(self, context, options=None, timing=None):
+        """Initializes Hangman State with `context`, `options` and `timing`."""
         self._context = context
+        self._options = options if options is not None else StateOptions()
+        self._timing = timing
 
-    def delete_game(self, name):
+    def _call(self, operation, method, argument, addresses, timeout):
+        """
+        Call a context method, record it if it's slow and turn
+        a timeout into an `InternalError` so the validator retries
+        the transaction.
+
+        Arguments:
+            operation: The name of the operation, e.g. `get`.
+            method: The context method to call.
+            argument: The argument to call `method` with.
+            addresses: The addresses concerned.
+            timeout: The timeout in seconds.
+        Returns:
+            The result of `method`.
+        Raises:
+            An `InternalError` if the call timed out.
+        """
+        start = time.perf_counter()
+        try:
+            return method(argument, timeout=timeout)
+        except FutureTimeoutError:
+            raise InternalError("Timed out after {}s on {} state {}".format(
+                timeout, operation, addresses
+            ))
+        finally:
+            elapsed = time.perf_counter() - start
+            if self._timing is not None:
+                self._timing.add(
+                    PHASE_READ if operation == "get" else PHASE_WRITE, elapsed
+                )
+            if elapsed >= self._options.slow_call_threshold:
+                SLOW_CALLS.append({
+                    "operation": operation,
+                    "addresses": addresses,
+                    "elapsed": elapsed,
+                    "time": time.time(),
+                })
+                LOGGER.warning("Slow {} state call on {}: {:.3f}s".format(
+                    operation, addresses, elapsed
+                ))
+
+    def _get_state(self, addresses):
+        """
+        Read state, timed out reads are retried with jitter.
+
+        Arguments:
+            addresses: The addresses to read.
+        Returns:
+            The list of entries found.
+        Raises:
+            An `InternalError` if all attempts timed out.
+        """
+        attempt = 0
+        while True:
+            try:
+                return self._call(
+                    "get", self._context.get_state, addresses,
+                    addresses, self._options.get_timeout
+                )
+            except InternalError:
+                if attempt >= self._options.get_retries:
+                    raise
+                attempt += 1
+                delay = self._options.retry_delay * attempt
+                delay += random.uniform(0, self._options.retry_delay)
+                LOGGER.warning("Retrying get state on {} in {:.3f}s".format(
+                    addresses, delay
+                ))
+                time.sleep(delay)
+
+    def _set_state(self, entries):
+        """
+        Write state.
+
+        Arguments:
+            entries: A dictionary mapping addresses to data.
+        Returns:
+            The list of addresses set.
+        Raises:
+            An `InternalError` if the call timed out.
+        """
+        return self._call(
+            "set", self._context.set_state, entries,
+            list(entries), self._options.set_timeout
+        )
+
+    def _delete_state(self, addresses):
+        """
+        Delete state.
+
+        Arguments:
+            addresses: The addresses to delete.
+        Returns:
+            The list of addresses deleted.
+        Raises:
+            An `InternalError` if the call timed out.
+        """
+        return self._call(
+            "delete", self._context.delete_state, addresses,
+            addresses, self._options.delete_timeout
+        )
+
+    def add_event(self, event_type, attributes, address):
+        """
+        Emit an event, with the same timeout handling as state writes.
+
+        Arguments:
+            event_type: The type of the event.
+            attributes: A list of key and value tuples.
+            address: The address the event concerns, used in error messages.
+        Returns:
+            -
+        Raises:
+            An `InternalError` if the call timed out.
+        """
+        self._call(
+            "event", partial(self._context.add_event, attributes=attributes),
+            event_type, [address], self._options.set_timeout
+        )
+
+    def delete_game(self, name, host=None):
         """
         Delete game from state.
 
         Arguments:
             name: The name of the game to delete.
+            host: The host for address scheme v2, None for scheme v1.
         Returns:
             -
         Raises:
             A `KeyError` if the game doesn't exist in the state.
         """
-        game = self.get_game(name)
+        game = self.get_game(name, host)
         if game:
-            address = _make_hm_address(name)
-            self._context.delete_state([address], timeout=TIMEOUT)
+            address = _make_hm_address(name, host)
+            self._delete_state([address])
         else:
             raise KeyError
 
-    def set_game(self, name, game):
+    def set_game(self, name, game, host=None):
         """
         Set new game information in the state.
 
         Arguments:
             name: The name of the game to set information for.
             game: The new game information to set.
+            host: The host for address scheme v2, None for scheme v1.
         Returns:
             -
         """
-        address = _make_hm_address(name)
-        state_s = self._context.get_state([address], timeout=TIMEOUT)
-        LOGGER.debug("Retrieved serialized state: {}".format(state_s))
-        LOGGER.debug("length: {}".format(len(state_s)))
-        LOGGER.debug("type: {}".format(type(state_s)))
-        if len(state_s) > 0:
-            state_de = loads(state_s[0].data)
-        else:
-            state_de = []
+        address = _make_hm_address(name, host)
+        state_de = self._get_history(address)
         state_de.append(game.to_dict())
         state_s = dumps(state_de)
         LOGGER.debug("Setting state: {} ({})".format(state_de, state_s))
-        self._context.set_state({address: state_s}, timeout=TIMEOUT)
+        self._set_state({address: state_s})
 
-    def get_game(self, name):
+    def get_game(self, name, host=None):
         """
         Get game information from the state.
 
         Arguments:
             name: The name of the game to get information for.
+            host: The host for address scheme v2, None for scheme v1.
         Returns:
             The game information or None if no information available.
         """
-        address = _make_hm_address(name)
-        state_s = self._context.get_state([address], timeout=TIMEOUT)
+        state_de = self._get_history(_make_hm_address(name, host))
+        if len(state_de) > 0:
+            return Game.from_dict(state_de[-1])
+        else:
+            return None
+
+    def migrate_game(self, name, host):
+        """
+        Move a game and its history from address scheme v1 to v2.
+
+        Arguments:
+            name: The name of the game to migrate.
+            host: The host of the game.
+        Returns:
+            -
+        Raises:
+            A `KeyError` if the game doesn't exist in the state.
+        """
+        old_address = _make_hm_address(name)
+        state_de = self._get_history(old_address)
+        if len(state_de) == 0:
+            raise KeyError
+        self._set_state({_make_hm_address(name, host): dumps(state_de)})
+        self._delete_state([old_address])
+
+    def _get_history(self, address):
+        """
+        Get the history of the game at `address`.
+
+        Arguments:
+            address: The address of the game.
+        Returns:
+            The list of game dictionaries, empty if there is no game.
+        """
+        state_s = self._get_state([address])
         LOGGER.debug("Retrieved serialized state: {}".format(state_s))
         LOGGER.debug("length: {}".format(len(state_s)))
         LOGGER.debug("type: {}".format(type(state_s)))
         if len(state_s) > 0:
             state_de = loads(state_s[0].data)
             LOGGER.debug("Retrieved deserialized state: {}".format(state_de))
-            return Game.from_dict(state_de[-1])
-        else:
+            return state_de
+        return []
+
+    def get_block_number(self):
+        """
+        Get the number of the latest block from the Block Info
+        transaction family.
+
+        Returns:
+            The number of the latest block or None if no block info
+            is available.
+        """
+        state_s = self._get_state([BLOCK_INFO_CONFIG_ADDRESS])
+        if len(state_s) == 0:
             return None
+        config = BlockInfoConfig()
+        config.ParseFromString(state_s[0].data)
+        return config.latest_block
+
+    def get_retention_blocks(self):
+        """
+        Get the number of blocks after which finished games can be pruned.
+
+        Returns:
+            The value of the `sawtooth.hm.retention_blocks` setting,
+            or `RETENTION_BLOCKS` if it isn't set or invalid.
+        """
+        address = _make_settings_address(SETTING_RETENTION_BLOCKS)
+        state_s = self._get_state([address])
+        if len(state_s) > 0:
+            setting = Setting()
+            setting.ParseFromString(state_s[0].data)
+            for entry in setting.entries:
+                if entry.key == SETTING_RETENTION_BLOCKS:
+                    try:
+                        return int(entry.value)
+                    except ValueError:
+                        LOGGER.warning("Invalid setting {}: '{}'".format(
+                            SETTING_RETENTION_BLOCKS, entry.value
+                        ))
+        return RETENTION_BLOCKS
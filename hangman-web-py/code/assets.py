@@ -0,0 +1,125 @@
+#!/usr/bin/env python3.5
+# encoding: utf-8
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+# Number of hex characters of the content hash used in fingerprinted names
+FINGERPRINT_LENGTH = 12
+
+# Cache-Control for fingerprinted names, their content can never change
+CACHE_CONTROL_IMMUTABLE = "public, max-age=31536000, immutable"
+# Cache-Control for plain names, clients have to revalidate via ETag
+CACHE_CONTROL_REVALIDATE = "public, no-cache"
+
+# Content types worth compressing, images are compressed already
+COMPRESSIBLE_TYPES = (
+    "text/css", "text/html", "text/plain",
+    "application/javascript", "text/javascript",
+    "application/json", "image/svg+xml",
+)
+# Files smaller than this aren't compressed
+MIN_COMPRESS_SIZE = 512
+
+
+def _fingerprint(path, digest):
+    """
+    Inserts the content hash into a file name,
+    e.g. `bulma.min.css` becomes `bulma.min.<hash>.css`.
+
+    Arguments:
+        path: The path of the file relative to the static directory.
+        digest: The hex digest of the file content.
+    Returns:
+        The fingerprinted path.
+    """
+    root, ext = os.path.splitext(path)
+    return "{}.{}{}".format(root, digest[:FINGERPRINT_LENGTH], ext)
+
+
+class Asset:
+    """
+    A static file held in memory, short `Asset`.
+
+    Arguments:
+        path: The path of the file relative to the static directory.
+        data: The content of the file.
+    """
+
+    def __init__(self, path, data):
+        """Initializes the asset with `path` and `data`."""
+        digest = hashlib.sha256(data).hexdigest()
+        self.path = path
+        self.fingerprinted_path = _fingerprint(path, digest)
+        self.etag = digest
+        self.mimetype = mimetypes.guess_type(path)[0] or \
+            "application/octet-stream"
+        self.data = data
+        self.gzip_data = None
+        if self.mimetype in COMPRESSIBLE_TYPES and \
+                len(data) >= MIN_COMPRESS_SIZE:
+            compressed = gzip.compress(data, compresslevel=9)
+            if len(compressed) < len(data):
+                self.gzip_data = compressed
+
+
+class AssetStore:
+    """
+    Loads all files of a static directory into memory once, so serving
+    them doesn't do any disk I/O. Every file is reachable under its plain
+    name and under a fingerprinted name containing its content hash.
+
+    Arguments:
+        directory: The static directory to load.
+    """
+
+    def __init__(self, directory):
+        """Initializes the asset store from `directory`."""
+        self._assets = {}
+        self._urls = {}
+        for root, _, files in os.walk(directory):
+            for file_name in files:
+                full_path = os.path.join(root, file_name)
+                path = os.path.relpath(full_path, directory).replace(
+                    os.sep, "/"
+                )
+                with open(full_path, "rb") as f:
+                    asset = Asset(path, f.read())
+                self._assets[path] = asset
+                self._assets[asset.fingerprinted_path] = asset
+                self._urls[path] = asset.fingerprinted_path
+                LOGGER.debug("Loaded asset '{}' as '{}'".format(
+                    path, asset.fingerprinted_path
+                ))
+
+    def fingerprinted_path(self, path):
+        """
+        Get the fingerprinted path of a file.
+
+        Arguments:
+            path: The plain path of the file.
+        Returns:
+            The fingerprinted path, or `path` if the file is unknown.
+        """
+        return self._urls.get(path, path)
+
+    def get(self, path):
+        """
+        Get an asset by its plain or fingerprinted path.
+
+        Arguments:
+            path: The path of the file.
+        Returns:
+            A tuple of the `Asset` (or None if unknown) and whether
+            `path` was fingerprinted.
+        """
+        asset = self._assets.get(path)
+        if asset is None:
+            return None, False
+        return asset, path == asset.fingerprinted_path
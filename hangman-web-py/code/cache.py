@@ -0,0 +1,120 @@
+#!/usr/bin/env python3.5
+# encoding: utf-8
+
+import logging
+
+from collections import OrderedDict
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+# The default number of entries kept in the cache
+DEFAULT_MAX_SIZE = 1024
+
+
+class LRUCache:
+    """
+    A simple Least Recently Used cache, short `LRUCache`.
+    Entries are kept in insertion/access order, the least recently
+    used entry is evicted once `max_size` is exceeded.
+    Every key has a generation which changes when it's invalidated, so a
+    value fetched while the key was invalidated isn't cached, see `put`.
+
+    Arguments:
+        max_size: The maximum number of entries to keep.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        """Initializes the LRU cache with `max_size`."""
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # The generations of invalidated keys, all other keys are at
+        # `_floor`, both only ever increase
+        self._generations = {}
+        self._counter = 0
+        self._floor = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """
+        Get an entry from the cache and mark it as recently used.
+
+        Arguments:
+            key: The key of the entry.
+            default: What to return in case the key isn't cached.
+        Returns:
+            The cached value or `default`.
+        """
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries[key] = value
+        self.hits += 1
+        return value
+
+    def generation(self, key):
+        """
+        Get the generation of a key, read it before fetching the value.
+
+        Arguments:
+            key: The key of the entry.
+        Returns:
+            The current generation of `key`.
+        """
+        return self._generations.get(key, self._floor)
+
+    def put(self, key, value, generation=None):
+        """
+        Put an entry into the cache, evicting the least recently used
+        entry if the cache is full. If `generation` is given and the key
+        was invalidated since, the value is stale and isn't cached.
+
+        Arguments:
+            key: The key of the entry.
+            value: The value to cache.
+            generation: The generation of `key` read before fetching `value`.
+        Returns:
+            -
+        """
+        if generation is not None and generation != self.generation(key):
+            LOGGER.debug("Not caching stale '{}'".format(key))
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        if len(self._entries) > self._max_size:
+            evicted, _ = self._entries.popitem(last=False)
+            LOGGER.debug("Evicted '{}' from cache".format(evicted))
+
+    def invalidate(self, key):
+        """
+        Remove an entry from the cache if present and
+        advance the generation of the key.
+
+        Arguments:
+            key: The key of the entry.
+        Returns:
+            -
+        """
+        self._entries.pop(key, None)
+        self._counter += 1
+        if len(self._generations) >= self._max_size:
+            # Forget the generations, which advances all keys at once
+            self._generations.clear()
+            self._floor = self._counter
+        self._generations[key] = self._counter
+
+    def clear(self):
+        """Remove all entries from the cache and advance all generations."""
+        self._entries.clear()
+        self._counter += 1
+        self._generations.clear()
+        self._floor = self._counter
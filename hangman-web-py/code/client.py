@@ -0,0 +1,145 @@
+#!/usr/bin/env python3.5
+# encoding: utf-8
+
+import base64
+import hashlib
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+from cbor2 import loads
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+# Sawtooth REST API endpoints which we're going to use
+REST_API_URL = "http://rest-api:8008"
+REST_API_ENDPOINT_STATE = "/state/{}"
+REST_API_ENDPOINT_STATE_PREFIX = "/state?address={}"
+
+# The prefix for the Hangman address space, translates to `b89bcb`
+HM_NAMESPACE = hashlib.sha512("hangman".encode("utf-8")).hexdigest()[0:6]
+
+# The number of hash characters of the host in address scheme v2
+HOST_HASH_LENGTH = 8
+
+# Connection pool settings shared by all requests to the REST API
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 32
+TIMEOUT = 5
+
+
+def _make_hm_host_prefix(host):
+    """
+    Creates the prefix of all games hosted by `host` in the
+    Hangman address space (address scheme v2).
+
+    Arguments:
+        host: The public key of the host.
+    Returns:
+        The prefix (`HM_NAMESPACE` + `HM_HOST`, 14 characters long).
+    """
+    return HM_NAMESPACE + \
+        hashlib.sha512(host.encode("utf-8")).hexdigest()[:HOST_HASH_LENGTH]
+
+
+def _make_hm_address(name, host=None):
+    """
+    Creates an address in the Hangman address space
+    in order to read state information.
+    If `host` is given the address scheme v2 is used, see `hangman-tp-py`.
+
+    Arguments:
+        name: The name of the game.
+        host: The public key of the host for scheme v2, None for scheme v1.
+    Returns:
+        An address in the Hangman address space (70 characters long).
+    """
+    if host is None:
+        return HM_NAMESPACE + \
+            hashlib.sha512(name.encode("utf-8")).hexdigest()[:64]
+    return _make_hm_host_prefix(host) + \
+        hashlib.sha512(name.encode("utf-8")).hexdigest()[:64 - HOST_HASH_LENGTH]
+
+
+def decode_history(data):
+    """
+    Decode the base64 encoded CBOR game history as returned by the REST API.
+
+    Arguments:
+        data: The base64 encoded state data.
+    Returns:
+        The list of game dictionaries, oldest first.
+    """
+    return loads(base64.b64decode(data))
+
+
+class StateClient:
+    """
+    A client for the Sawtooth REST API which reads Hangman state.
+    All requests share one `requests.Session` and therefore one
+    connection pool, so keep-alive connections are reused.
+
+    Arguments:
+        url: The base URL of the REST API.
+    """
+
+    def __init__(self, url=REST_API_URL):
+        """Initializes the state client with `url`."""
+        self._url = url
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=POOL_CONNECTIONS,
+            pool_maxsize=POOL_MAXSIZE
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def _get(self, url):
+        r = self._session.get(url, timeout=TIMEOUT)
+        if r.status_code == 404:
+            return None
+        r.raise_for_status()
+        return r.json()
+
+    def get_history(self, address):
+        """
+        Get the full history of a game.
+
+        Arguments:
+            address: The address of the game.
+        Returns:
+            The list of game dictionaries or None if the game doesn't exist.
+        """
+        ret_json = self._get(
+            self._url + REST_API_ENDPOINT_STATE.format(address)
+        )
+        if ret_json is None:
+            return None
+        return decode_history(ret_json["data"])
+
+    def list_games(self, prefix=HM_NAMESPACE):
+        """
+        Get the current state of all games below `prefix`.
+        Follows the REST API paging until all entries are read.
+        Use `_make_hm_host_prefix` to only read the games of one host
+        stored under address scheme v2.
+
+        Arguments:
+            prefix: The address prefix to query, by default `HM_NAMESPACE`.
+        Returns:
+            A dictionary mapping addresses to the latest game dictionary.
+        """
+        games = {}
+        url = self._url + REST_API_ENDPOINT_STATE_PREFIX.format(prefix)
+        while url:
+            ret_json = self._get(url)
+            if ret_json is None:
+                break
+            for entry in ret_json["data"]:
+                history = decode_history(entry["data"])
+                if history:
+                    games[entry["address"]] = history[-1]
+            url = ret_json.get("paging", {}).get("next")
+        LOGGER.debug("Read {} games below '{}'".format(len(games), prefix))
+        return games
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3.5
+# encoding: utf-8
+
+"""
+Decoding of Sawtooth events into Hangman game updates.
+
+The decoding is split into generator stages which can be used on their own
+or chained via `game_updates`, which turns raw ZMQ frames into `GameUpdate`
+instances:
+
+    frames -> messages -> events -> state_changes -> decode_changes
+"""
+
+import logging
+
+from collections import namedtuple
+
+from cbor2 import CBORError, loads
+from sawtooth_sdk.protobuf.events_pb2 import EventList
+from sawtooth_sdk.protobuf.transaction_receipt_pb2 import (
+    StateChange, StateChangeList
+)
+from sawtooth_sdk.protobuf.validator_pb2 import Message
+
+from cache import LRUCache
+from client import HM_NAMESPACE, _make_hm_address
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+# The event type carrying state changes
+EVENT_TYPE_STATE_DELTA = "sawtooth/state-delta"
+
+# The event type sent for every committed block
+EVENT_TYPE_BLOCK_COMMIT = "sawtooth/block-commit"
+
+# The default number of names kept in the address table
+DEFAULT_TABLE_SIZE = 4096
+
+# A decoded update of a game, `game` is None if the game was deleted
+GameUpdate = namedtuple("GameUpdate", ["address", "name", "game"])
+
+
+def decode_last_game(data):
+    """
+    Decodes the last entry of a CBOR encoded game history.
+    The whole history is decoded by `cbor2`, which is faster than
+    skipping the preceding entries in Python for all but the
+    shortest histories.
+
+    Arguments:
+        data: The CBOR encoded list of games.
+    Returns:
+        The last game dictionary or None if the history is empty.
+    Raises:
+        A `ValueError` if `data` isn't a CBOR encoded list.
+    """
+    try:
+        history = loads(data)
+    except CBORError as e:
+        raise ValueError(str(e))
+    if not isinstance(history, list):
+        raise ValueError("Expected a CBOR array, got {}".format(
+            type(history).__name__
+        ))
+    return history[-1] if history else None
+
+
+class AddressTable:
+    """
+    A bounded table mapping game names to addresses and back.
+    Hashing a name (and host for address scheme v2) is cached,
+    addresses are mapped back to the name of the last game seen
+    at that address.
+
+    Arguments:
+        max_size: The maximum number of names to keep.
+    """
+
+    def __init__(self, max_size=DEFAULT_TABLE_SIZE):
+        """Initializes the address table with `max_size`."""
+        self._addresses = LRUCache(max_size)
+        self._names = LRUCache(max_size)
+
+    def address(self, name, host=None):
+        """
+        Get the address of a game.
+
+        Arguments:
+            name: The name of the game.
+            host: The host for address scheme v2, None for scheme v1.
+        Returns:
+            The address of the game.
+        """
+        address = self._addresses.get((name, host))
+        if address is None:
+            address = _make_hm_address(name, host)
+            self._addresses.put((name, host), address)
+            self._names.put(address, name)
+        return address
+
+    def name(self, address):
+        """
+        Get the name of the game at an address.
+
+        Arguments:
+            address: The address of the game.
+        Returns:
+            The name of the game or None if unknown.
+        """
+        return self._names.get(address)
+
+    def remember(self, address, name):
+        """
+        Record the name of the game at an address.
+
+        Arguments:
+            address: The address of the game.
+            name: The name of the game.
+        Returns:
+            -
+        """
+        self._names.put(address, name)
+
+
+def messages(frames):
+    """
+    Parses ZMQ frames into validator messages.
+
+    Arguments:
+        frames: An iterable of serialized `Message` instances.
+    Yields:
+        `Message` instances.
+    """
+    for frame in frames:
+        msg = Message()
+        msg.ParseFromString(frame)
+        yield msg
+
+
+def events(msgs):
+    """
+    Unpacks the events of `CLIENT_EVENTS` messages,
+    any other message is skipped.
+
+    Arguments:
+        msgs: An iterable of `Message` instances.
+    Yields:
+        `Event` instances.
+    """
+    for msg in msgs:
+        if msg.message_type != Message.CLIENT_EVENTS:
+            continue
+        event_list = EventList()
+        event_list.ParseFromString(msg.content)
+        yield from event_list.events
+
+
+def state_changes(evts, prefix=HM_NAMESPACE):
+    """
+    Unpacks the state changes of state delta events,
+    keeping only those in the address space `prefix`.
+
+    Arguments:
+        evts: An iterable of `Event` instances.
+        prefix: The address prefix to keep, by default `HM_NAMESPACE`,
+            or a tuple of prefixes.
+    Yields:
+        `StateChange` instances.
+    """
+    for event in evts:
+        if event.event_type != EVENT_TYPE_STATE_DELTA:
+            continue
+        changes = StateChangeList()
+        changes.ParseFromString(event.data)
+        for change in changes.state_changes:
+            if change.address.startswith(prefix):
+                yield change
+
+
+def block_commit(evts):
+    """
+    Returns the attributes of the block commit event among `evts`.
+
+    Arguments:
+        evts: An iterable of `Event` instances.
+    Returns:
+        A dictionary with the `block_id`, `block_num`, `previous_block_id`
+        and `state_root_hash` of the block, or None if there's no such event.
+    """
+    for event in evts:
+        if event.event_type == EVENT_TYPE_BLOCK_COMMIT:
+            return {a.key: a.value for a in event.attributes}
+    return None
+
+
+def decode_changes(changes, table):
+    """
+    Decodes state changes into game updates,
+    the last entry of each game history.
+
+    Arguments:
+        changes: An iterable of `StateChange` instances.
+        table: The `AddressTable` to record/look up names in.
+    Yields:
+        `GameUpdate` instances.
+    """
+    for change in changes:
+        if change.type == StateChange.DELETE:
+            yield GameUpdate(change.address, table.name(change.address), None)
+            continue
+        try:
+            game = decode_last_game(change.value)
+        except ValueError as e:
+            LOGGER.warning("Can't decode state at '{}': {}".format(
+                change.address, e
+            ))
+            continue
+        if game is None:
+            continue
+        table.remember(change.address, game["name"])
+        yield GameUpdate(change.address, game["name"], game)
+
+
+def game_updates(frames, table=None, prefix=HM_NAMESPACE):
+    """
+    The complete pipeline, turns ZMQ frames into game updates.
+
+    Arguments:
+        frames: An iterable of serialized `Message` instances.
+        table: The `AddressTable` to use, a new one if None.
+        prefix: The address prefix to keep, by default `HM_NAMESPACE`.
+    Returns:
+        A generator of `GameUpdate` instances.
+    """
+    if table is None:
+        table = AddressTable()
+    return decode_changes(
+        state_changes(events(messages(frames)), prefix), table
+    )
+
+
+def _benchmark(blocks=2000, games_per_block=5, history_length=20):
+    """
+    Measures the throughput of the pipeline on synthetic events.
+
+    Arguments:
+        blocks: The number of `CLIENT_EVENTS` messages to decode.
+        games_per_block: The number of changed games per message.
+        history_length: The number of entries in each game history.
+    Returns:
+        -
+    """
+    import time
+    from cbor2 import dumps
+    from sawtooth_sdk.protobuf.events_pb2 import Event
+
+    frames = []
+    for block in range(blocks):
+        changes = []
+        for i in range(games_per_block):
+            name = "Game {}".format(block * games_per_block + i)
+            history = [{
+                "name": name, "word": "Weatherman", "misses": "iou"[:j % 4],
+                "hits": "ae", "host": 66 * "0", "guesser": "", "state": 1,
+            } for j in range(history_length)]
+            changes.append(StateChange(
+                address=_make_hm_address(name),
+                value=dumps(history),
+                type=StateChange.SET
+            ))
+        event = Event(
+            event_type=EVENT_TYPE_STATE_DELTA,
+            data=StateChangeList(state_changes=changes).SerializeToString()
+        )
+        frames.append(Message(
+            message_type=Message.CLIENT_EVENTS,
+            content=EventList(events=[event]).SerializeToString()
+        ).SerializeToString())
+
+    start = time.perf_counter()
+    count = sum(1 for _ in game_updates(frames))
+    elapsed = time.perf_counter() - start
+    print("Decoded {} updates from {} messages in {:.3f}s ({:.0f} updates/s)".format(
+        count, len(frames), elapsed, count / elapsed
+    ))
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3.5
+# encoding: utf-8
+
+import logging
+
+from collections import OrderedDict
+
+from gevent.event import Event
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+# The default number of updates buffered per client
+DEFAULT_BUFFER_SIZE = 64
+
+
+class FanOutStats:
+    """
+    Counters of a `FanOut`, shared by all of its client buffers.
+    """
+
+    def __init__(self):
+        """Initializes all counters with zero."""
+        self.published = 0
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def to_dict(self):
+        """
+        Return dictionary presentation of the counters.
+
+        Returns:
+            A dictionary presentation of the counters.
+        """
+        return {
+            "published": self.published,
+            "delivered": self.delivered,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+        }
+
+
+class ClientBuffer:
+    """
+    A bounded send buffer for one client.
+    Updates are keyed, e.g. by game address. If an update for a key is
+    still pending it's replaced by the newer one (coalesced), so a lagging
+    client only receives the latest state of each game. If the buffer is
+    full the oldest pending update is dropped.
+
+    Arguments:
+        max_size: The maximum number of pending updates.
+        stats: The `FanOutStats` to count in.
+    """
+
+    def __init__(self, max_size, stats):
+        """Initializes the client buffer with `max_size` and `stats`."""
+        self._max_size = max_size
+        self._stats = stats
+        self._pending = OrderedDict()
+        self._ready = Event()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def put(self, key, data):
+        """
+        Buffer an update, never blocks.
+
+        Arguments:
+            key: The key to coalesce updates by.
+            data: The update to send.
+        Returns:
+            -
+        """
+        if key in self._pending:
+            self._stats.coalesced += 1
+        elif len(self._pending) >= self._max_size:
+            self._pending.popitem(last=False)
+            self._stats.dropped += 1
+        self._pending[key] = data
+        self._ready.set()
+
+    def get(self, timeout=None):
+        """
+        Get the oldest pending update, waits until one is available.
+
+        Arguments:
+            timeout: How long to wait in seconds, forever if None.
+        Returns:
+            The update or None if the timeout expired.
+        """
+        if not self._pending and not self._ready.wait(timeout):
+            return None
+        _, data = self._pending.popitem(last=False)
+        if not self._pending:
+            self._ready.clear()
+        self._stats.delivered += 1
+        return data
+
+
+class FanOut:
+    """
+    Distributes updates to the bounded buffers of all registered clients.
+
+    Arguments:
+        buffer_size: The maximum number of pending updates per client.
+    """
+
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE):
+        """Initializes the fan-out with `buffer_size`."""
+        self._buffer_size = buffer_size
+        self._clients = set()
+        self.stats = FanOutStats()
+
+    def __len__(self):
+        return len(self._clients)
+
+    def register(self):
+        """
+        Register a new client.
+
+        Returns:
+            The `ClientBuffer` of the new client.
+        """
+        client = ClientBuffer(self._buffer_size, self.stats)
+        self._clients.add(client)
+        return client
+
+    def unregister(self, client):
+        """
+        Unregister a client.
+
+        Arguments:
+            client: The `ClientBuffer` of the client.
+        Returns:
+            -
+        """
+        self._clients.discard(client)
+
+    def publish(self, key, data):
+        """
+        Hand an update to all clients.
+
+        Arguments:
+            key: The key to coalesce updates by.
+            data: The update to send.
+        Returns:
+            -
+        """
+        self.stats.published += 1
+        for client in self._clients:
+            client.put(key, data)
+
+
+def _stress(clients=100, games=20000, updates=50000, max_growth_kb=32768,
+            endpoint="ipc:///tmp/hangman-web-stress"):
+    """
+    Pushes synthetic updates of many more games than fit into a client
+    buffer along the path of a worker: from the local channel through
+    `receive_updates` and `handle_update` into the buffers of WebSocket
+    clients which never read. Checks that every update was handled, that
+    no buffer exceeds its size and that the peak RSS stays bounded.
+
+    Arguments:
+        clients: The number of lagging clients.
+        games: The number of distinct games updated.
+        updates: The number of updates to publish.
+        max_growth_kb: The allowed growth of the peak RSS in kilobytes.
+        endpoint: The endpoint of the local channel.
+    Returns:
+        True if all checks passed.
+    """
+    import random
+    import resource
+    import time
+
+    import gevent
+    import zmq.green as zmq
+
+    import main
+    from events import GameUpdate
+    from subscriber import Publisher, receive_updates
+
+    main.LOGGER.setLevel(logging.WARNING)
+    rand = random.Random(0)
+    fan_out = main.fan_out
+    buffers = [fan_out.register() for _ in range(clients)]
+    publisher = Publisher(zmq.Context(), endpoint)
+    receiver = gevent.spawn(
+        receive_updates, main.handle_update, main.handle_ping,
+        main.handle_resync, endpoint
+    )
+    # Give the receiver time to connect
+    gevent.sleep(0.5)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    for i in range(updates):
+        game = rand.randrange(games)
+        name = "game-{}".format(game)
+        publisher.update(GameUpdate("b89bcb{:064x}".format(game), name, {
+            "name": name, "word": "Weatherman", "misses": "xyz", "hits": "ae",
+            "host": "02ab", "guesser": "03cd", "state": 1, "ended_at": None,
+        }))
+        # Let the receiver catch up, the channel drops updates
+        # beyond its high-water mark
+        deadline = time.time() + 10
+        while fan_out.stats.published <= i - 100 and time.time() < deadline:
+            gevent.sleep(0.001)
+    deadline = time.time() + 10
+    while fan_out.stats.published < updates and time.time() < deadline:
+        gevent.sleep(0.01)
+    receiver.kill()
+    growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    largest = max(len(b) for b in buffers)
+    print("Published {} updates of {} games to {} clients: {}, "
+          "largest buffer {} of {}, peak RSS growth {} kB".format(
+              updates, games, clients, fan_out.stats.to_dict(),
+              largest, main.WS_BUFFER_SIZE, growth
+          ))
+    for client in buffers:
+        fan_out.unregister(client)
+    return fan_out.stats.published == updates and \
+        largest <= main.WS_BUFFER_SIZE and growth <= max_growth_kb
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(0 if _stress() else 1)
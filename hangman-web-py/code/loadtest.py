@@ -0,0 +1,321 @@
+#!/usr/bin/env python3.5
+# encoding: utf-8
+
+"""
+Load test of the web service with an increasing number of worker processes.
+
+For every worker count the service (`main.py`) is started without its
+subscriber process, this script publishes synthetic game updates on the
+local channel instead, so no validator is needed. Load is generated by
+separate client processes, which run this script in client mode:
+
+- HTTP: keep-alive connections request `--path` as fast as possible,
+  the requests per second are reported.
+- WebSocket: clients connect to `/zmq` while updates are published at
+  `--rate` updates per second, the updates delivered per second are
+  reported. They fall short of the rate times the number of WebSockets
+  once the workers can't keep up.
+
+Capacity can only scale with the workers if there are enough CPU cores for
+the workers and the client processes.
+"""
+
+import argparse
+import base64
+import json
+import os
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+APP_NAME = "Hangman Web Load Test"
+
+# The endpoint of the local channel used during the load test
+UPDATES_ENDPOINT = "ipc:///tmp/hangman-web-loadtest"
+
+# The number of distinct games updates are published for
+GAMES = 1000
+
+# How long to wait in seconds for the service to accept connections
+STARTUP_TIMEOUT = 30
+
+
+def _connect(port):
+    return socket.create_connection(("127.0.0.1", port))
+
+
+def _read_exactly(f, size):
+    data = f.read(size)
+    if len(data) < size:
+        raise EOFError
+    return data
+
+
+def client_http(port, path, connections, seconds):
+    """
+    Request `path` on `connections` keep-alive connections for `seconds`.
+
+    Returns:
+        The number of successful requests.
+    """
+    from gevent import monkey
+    monkey.patch_all()
+    import gevent
+    from http.client import HTTPConnection
+
+    count = [0]
+    deadline = time.time() + seconds
+
+    def run():
+        conn = HTTPConnection("127.0.0.1", port)
+        while time.time() < deadline:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                count[0] += 1
+
+    gevent.joinall([gevent.spawn(run) for _ in range(connections)])
+    return count[0]
+
+
+def client_websocket(port, connections, seconds):
+    """
+    Open `connections` WebSockets to `/zmq`, prints `ready` once all are
+    open and counts the messages received within `seconds` after that.
+
+    Returns:
+        The number of messages received.
+    """
+    from gevent import monkey
+    monkey.patch_all()
+    import gevent
+
+    files = []
+    for _ in range(connections):
+        sock = _connect(port)
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        sock.sendall((
+            "GET /zmq HTTP/1.1\r\n"
+            "Host: 127.0.0.1:{}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            "Sec-WebSocket-Key: {}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n"
+        ).format(port, key).encode("ascii"))
+        f = sock.makefile("rb")
+        status = f.readline()
+        if b" 101 " not in status:
+            raise RuntimeError("WebSocket handshake failed: {}".format(status))
+        while f.readline() not in (b"\r\n", b""):
+            pass
+        files.append((sock, f))
+    print("ready", flush=True)
+
+    count = [0]
+    deadline = time.time() + seconds
+
+    def run(sock, f):
+        while True:
+            head = _read_exactly(f, 2)
+            length = head[1] & 0x7f
+            if length == 126:
+                length = struct.unpack(">H", _read_exactly(f, 2))[0]
+            elif length == 127:
+                length = struct.unpack(">Q", _read_exactly(f, 8))[0]
+            _read_exactly(f, length)
+            if time.time() < deadline:
+                count[0] += 1
+
+    greenlets = [gevent.spawn(run, sock, f) for sock, f in files]
+    gevent.sleep(max(deadline - time.time(), 0))
+    gevent.killall(greenlets)
+    return count[0]
+
+
+def _spawn_clients(mode, args, clients):
+    return [
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), mode] + [str(a) for a in args],
+            stdout=subprocess.PIPE, universal_newlines=True
+        )
+        for _ in range(clients)
+    ]
+
+
+def _collect(processes):
+    return sum(int(p.communicate()[0].split()[-1]) for p in processes)
+
+
+def _start_service(port, workers):
+    env = dict(
+        os.environ,
+        HM_WEB_PORT=str(port),
+        HM_WEB_WORKERS=str(workers),
+        HM_WEB_SUBSCRIBER="0",
+        HM_UPDATES_ENDPOINT=UPDATES_ENDPOINT,
+    )
+    service = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(__file__), "main.py")],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + STARTUP_TIMEOUT
+    while True:
+        try:
+            _connect(port).close()
+            return service
+        except OSError:
+            if time.time() > deadline:
+                service.kill()
+                raise RuntimeError("The service didn't start")
+            time.sleep(0.2)
+
+
+def _publish(publisher, rate, seconds):
+    sent = 0
+    start = time.time()
+    while time.time() < start + seconds:
+        # Publish in batches of 1/100 of a second
+        for _ in range(max(rate // 100, 1)):
+            name = "game-{}".format(sent % GAMES)
+            update = {
+                "address": "b89bcb{:064x}".format(sent % GAMES),
+                "name": name,
+                "game": {
+                    "name": name, "word": "Weatherman", "misses": "xyz",
+                    "hits": "ae", "host": "02ab", "guesser": "03cd",
+                    "state": 1, "ended_at": None,
+                },
+            }
+            sent += 1
+            # The topic, epoch and sequence number, see `subscriber.py`
+            publisher.send_multipart([
+                b"update", "loadtest:{}".format(sent).encode("utf-8"),
+                json.dumps(update).encode("utf-8")
+            ])
+        time.sleep(max(start + sent / rate - time.time(), 0))
+    return sent
+
+
+def run(workers_list, port, path, clients, connections, websockets, rate,
+        seconds):
+    """
+    Run the load test for every worker count in `workers_list`
+    and print a table of the results.
+    """
+    import zmq
+
+    ctx = zmq.Context()
+    publisher = ctx.socket(zmq.PUB)
+    publisher.bind(UPDATES_ENDPOINT)
+
+    print("{:>7} {:>12} {:>16} {:>16}".format(
+        "workers", "HTTP req/s", "WS updates/s", "WS deliveries/s"
+    ))
+    for workers in workers_list:
+        service = _start_service(port, workers)
+        try:
+            # Give the workers time to connect to the local channel
+            time.sleep(1)
+            processes = _spawn_clients(
+                "client-http", [port, path, connections, seconds], clients
+            )
+            http_rate = _collect(processes) / seconds
+
+            processes = _spawn_clients(
+                "client-websocket", [port, websockets, seconds], clients
+            )
+            for p in processes:
+                if p.stdout.readline().strip() != "ready":
+                    raise RuntimeError("A WebSocket client failed")
+            sent = _publish(publisher, rate, seconds)
+            delivered = _collect(processes)
+        finally:
+            service.send_signal(signal.SIGTERM)
+            service.wait()
+        print("{:>7} {:>12.0f} {:>16.0f} {:>16.0f}".format(
+            workers, http_rate, sent / seconds, delivered / seconds
+        ), flush=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "client-http":
+        port, path, connections, seconds = sys.argv[2:]
+        print(client_http(int(port), path, int(connections), float(seconds)))
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "client-websocket":
+        port, connections, seconds = sys.argv[2:]
+        print(client_websocket(int(port), int(connections), float(seconds)))
+        sys.exit(0)
+
+    # Declare the arguments
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=APP_NAME
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        default="1,2,4",
+        help="The worker counts to test, comma separated",
+    )
+    parser.add_argument(
+        "--port",
+        dest="port",
+        type=int,
+        default=5055,
+        help="The port to start the service on",
+    )
+    parser.add_argument(
+        "--path",
+        dest="path",
+        default="/stats",
+        help="The path requested by the HTTP clients",
+    )
+    parser.add_argument(
+        "--clients",
+        dest="clients",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="The number of client processes",
+    )
+    parser.add_argument(
+        "--connections",
+        dest="connections",
+        type=int,
+        default=50,
+        help="The number of HTTP connections per client process",
+    )
+    parser.add_argument(
+        "--websockets",
+        dest="websockets",
+        type=int,
+        default=100,
+        help="The number of WebSockets per client process",
+    )
+    parser.add_argument(
+        "--rate",
+        dest="rate",
+        type=int,
+        default=500,
+        help="The number of updates published per second",
+    )
+    parser.add_argument(
+        "--seconds",
+        dest="seconds",
+        type=float,
+        default=10,
+        help="How long to generate load per test",
+    )
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    run(
+        [int(w) for w in args.workers.split(",")], args.port, args.path,
+        args.clients, args.connections, args.websockets, args.rate,
+        args.seconds
+    )
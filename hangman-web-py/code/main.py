@@ -1,18 +1,31 @@
 #!/usr/bin/env python3.5
 # encoding: utf-8
 
+from gevent import monkey
+monkey.patch_all()
+
 import logging
+import os
 
-import zmq.green as zmq
+import gevent
 from flask_sockets import Sockets
-from flask import Flask, render_template, send_from_directory
-from sawtooth_sdk.protobuf.events_pb2 import (
-    EventSubscription, EventFilter, EventList
+from flask import (
+    Flask, Response, abort, jsonify, render_template, request, url_for
+)
+
+from assets import (
+    AssetStore, CACHE_CONTROL_IMMUTABLE, CACHE_CONTROL_REVALIDATE
 )
-from sawtooth_sdk.protobuf.client_event_pb2 import (
-    ClientEventsSubscribeRequest, ClientEventsSubscribeResponse
+from cache import LRUCache
+from client import (
+    StateClient, HM_NAMESPACE, HOST_HASH_LENGTH, _make_hm_host_prefix
 )
-from sawtooth_sdk.protobuf.validator_pb2 import Message
+from events import AddressTable, GameUpdate
+from fanout import FanOut
+from server import PreforkServer
+from stats import Leaderboard, DEFAULT_TOP
+from subscriber import receive_updates, run_subscriber
+from tracing import STAGE_DELIVERED, TracedData, trace
 
 # Set up logging
 LOGGER = logging.getLogger(__name__)
@@ -20,99 +33,234 @@ LOGGER.addHandler(logging.StreamHandler())
 LOGGER.setLevel(logging.DEBUG)
 
 # Set up Flask and Flask-Sockets
-app = Flask(__name__)
+# Flask's own static route is disabled, `send_static` serves from memory
+app = Flask(__name__, static_folder=None)
 sockets = Sockets(app)
 
-# Our local Sawtooth validator to connect to
-HOST = "validator"
-PORT = 4004
+# Load the static files into memory once
+assets = AssetStore(os.path.join(app.root_path, "static"))
+
+# The images shown for the number of misses
+GAME_IMAGES = ["60px-Hangman-{}.png".format(i) for i in range(7)]
+
+# The port to serve on and the number of worker processes
+HTTP_PORT = int(os.environ.get("HM_WEB_PORT", 5000))
+WORKERS = int(os.environ.get("HM_WEB_WORKERS", 1))
+
+# Whether to start the subscriber process which owns the validator
+# subscription, disable it if updates are published by another process
+SUBSCRIBER = os.environ.get("HM_WEB_SUBSCRIBER", "1") != "0"
+
+# The maximum number of updates buffered per WebSocket client
+WS_BUFFER_SIZE = int(os.environ.get("HM_WS_BUFFER_SIZE", 64))
+
+# Everything below is created per process, but none of it opens a
+# connection or starts a thread before it's used in a worker, so it's
+# safe to fork after import
 
-# Set up ZMQ
-ctx = zmq.Context()
-socket = ctx.socket(zmq.DEALER)
-socket.connect("tcp://{}:{}".format(HOST, PORT))
+# Set up the REST API client and the response cache
+# The cache is keyed by game address, lists of games are keyed by their
+# address prefix, see `games_key`
+state_client = StateClient()
+cache = LRUCache()
 
+# Maps game names to addresses and back
+table = AddressTable()
 
-def set_up_zmq_subscription():
+# Buffers of the connected WebSockets, filled by `handle_update`
+fan_out = FanOut(WS_BUFFER_SIZE)
+
+# Player statistics, updated by `handle_update`, replaced by `handle_resync`
+leaderboard = Leaderboard()
+
+# The greenlet running `seed_leaderboard`, if any
+seeding = None
+
+
+def games_key(prefix):
     """
-    This sends a subscription request to ZMQ.
-    See: https://sawtooth.hyperledger.org/docs/core/
-    releases/latest/app_developers_guide/zmq_event_subscription.html
+    Returns the cache key of the list of games below `prefix`.
     """
-    subscription = EventSubscription(
-        event_type="sawtooth/state-delta",
-        filters=[
-            EventFilter(
-                key="address",
-                match_string="b89bcb.*",
-                filter_type=EventFilter.REGEX_ANY)
-        ])
+    return "games:{}".format(prefix)
 
-    request = ClientEventsSubscribeRequest(
-        subscriptions=[subscription]
-    ).SerializeToString()
 
-    correlation_id = "123"  # This must be unique for all in-process requests
-    msg = Message(
-        correlation_id=correlation_id,
-        message_type=Message.MessageType.CLIENT_EVENTS_SUBSCRIBE_REQUEST,
-        content=request
-    )
+def seed_leaderboard():
+    """
+    Counts the games existing at startup once, all later
+    changes are counted from the state delta events. Games
+    updated while they're read are counted from the updates.
+    The games are counted into the leaderboard current when
+    seeding starts, not one which replaced it since.
+    """
+    board = leaderboard
+    try:
+        all_games = state_client.list_games()
+    except Exception as e:  # pylint: disable=broad-except
+        LOGGER.warning("Seeding the leaderboard failed: {}".format(e))
+        return
+    for address, game in all_games.items():
+        board.seed(GameUpdate(address, game["name"], game))
+    LOGGER.debug("Seeded the leaderboard with {} games".format(len(all_games)))
 
-    socket.send_multipart([msg.SerializeToString()])
 
-    resp = socket.recv_multipart()[-1]
+def handle_update(update, data, trace_ids=None):
+    """
+    Handles a game update received from the subscriber process, it
+    invalidates the response cache, updates the leaderboard and is
+    handed on to the connected WebSockets.
 
-    msg = Message()
-    msg.ParseFromString(resp)
+    Arguments:
+        update: The `GameUpdate`.
+        data: The JSON encoding of `update`.
+        trace_ids: The trace ids of the transactions which caused it.
+    Returns:
+        -
+    """
+    LOGGER.debug("Received update of '{}'".format(update.name))
+    cache.invalidate(update.address)
+    cache.invalidate(games_key(HM_NAMESPACE))
+    # Games stored under address scheme v2 are listed by host, too
+    host_prefix = update.address[:len(HM_NAMESPACE) + HOST_HASH_LENGTH]
+    cache.invalidate(games_key(host_prefix))
+    leaderboard.update(update)
+    if trace_ids:
+        data = TracedData(data, trace_ids)
+    fan_out.publish(update.address, data)
 
-    if msg.message_type != \
-       Message.MessageType.CLIENT_EVENTS_SUBSCRIBE_RESPONSE:
-        print("Unexpected message type")
-        exit(1)
 
-    response = ClientEventsSubscribeResponse()
-    response.ParseFromString(msg.content)
+def handle_resync():
+    """
+    Handles updates dropped on the way from the validator, the
+    response cache is cleared and the leaderboard is counted anew
+    from the games existing now.
+    """
+    global leaderboard, seeding
+    cache.clear()
+    leaderboard = Leaderboard()
+    if seeding is not None:
+        seeding.kill(block=False)
+    seeding = gevent.spawn(seed_leaderboard)
 
-    if response.status != ClientEventsSubscribeResponse.OK:
-        print("Subscription failed: {}".format(response.response_message))
-        exit(1)
 
-    LOGGER.debug("Setting up ZMQ subscription successful")
+def handle_ping():
+    """
+    Hands the validator's ping on to the connected WebSockets.
+    """
+    fan_out.publish("ping", "ping request")
+
+
+def run_worker(listener):
+    """
+    The main function of a worker process, serves `app` on the shared
+    `listener` and receives game updates from the subscriber process.
+    """
+    global seeding
+    from gevent import pywsgi
+    from geventwebsocket.handler import WebSocketHandler
+    gevent.spawn(receive_updates, handle_update, handle_ping, handle_resync)
+    seeding = gevent.spawn(seed_leaderboard)
+    server = pywsgi.WSGIServer(listener, app, handler_class=WebSocketHandler)
+    server.serve_forever()
 
 
 @sockets.route("/zmq")
 def zmq_socket(ws):
     """
-    Note: Currently unused
+    Note: Currently unused by `index.html`
     This transfers data from ZMQ to a web socket.
-    The idea was to do some pre-processing in Python
-    before handing it to the WebSocket and consume it
-    in the web interface.
-    However from the documentation it's not very clear
-    how the data provided in `EventList` is formatted.
-    """
-    LOGGER.debug("Entering ZMQ loop")
-    while True:
-        resp = socket.recv_multipart()[-1]
-
-        msg = Message()
-        msg.ParseFromString(resp)
-
-        if msg.message_type == Message.CLIENT_EVENTS:
-            events = EventList()
-            events.ParseFromString(msg.content)
-            LOGGER.debug("Received events")
-            LOGGER.debug(events)
-            # Eventually what we want to do here is ws.send(events)
-            # But before we have to unpack and pre-process it.
-        elif msg.message_type == Message.PING_REQUEST:
-            LOGGER.debug("Received ping request")
-            ws.send("ping request")
-        else:
-            LOGGER.warn("Unexpected message type '{}'".format(
-                msg.message_type
-            ))
+    Every game update is sent as JSON with the keys
+    `address`, `name` and `game`, `game` is null if
+    the game was deleted.
+    Updates are buffered per client, a lagging client only
+    receives the latest update of each game.
+    """
+    client = fan_out.register()
+    try:
+        while not ws.closed:
+            data = client.get()
+            ws.send(data)
+            for trace_id in getattr(data, "trace_ids", ()):
+                trace(trace_id, STAGE_DELIVERED)
+    finally:
+        fan_out.unregister(client)
+
+
+@app.route("/zmq/stats")
+def zmq_stats():
+    """
+    Serves the counters of the WebSocket fan-out as JSON.
+    """
+    stats = fan_out.stats.to_dict()
+    stats["clients"] = len(fan_out)
+    return jsonify(stats)
+
+
+@app.route("/stats")
+def stats():
+    """
+    Serves the player statistics as JSON, the players with the most
+    wins and the most played words. The `top` query parameter sets
+    how many of each are served.
+    """
+    top = request.args.get("top", DEFAULT_TOP, type=int)
+    return jsonify(leaderboard.to_dict(top))
+
+
+def get_history(name):
+    """
+    Returns the history of game `name`, served from
+    the cache if possible, otherwise read via REST API.
+    Games stored under address scheme v2 are selected
+    with the `host` query parameter.
+    """
+    address = table.address(name, request.args.get("host"))
+    history = cache.get(address)
+    if history is None:
+        # Not cached if an update invalidates it while it's being read
+        generation = cache.generation(address)
+        history = state_client.get_history(address)
+        if history is None:
+            abort(404)
+        cache.put(address, history, generation)
+    return history
+
+
+@app.route("/games")
+def games():
+    """
+    Serves the current state of all games as JSON.
+    With the `host` query parameter only the games of that
+    host stored under address scheme v2 are served, they're
+    read with a single prefix query.
+    """
+    host = request.args.get("host")
+    prefix = HM_NAMESPACE if host is None else _make_hm_host_prefix(host)
+    all_games = cache.get(games_key(prefix))
+    if all_games is None:
+        generation = cache.generation(games_key(prefix))
+        all_games = sorted(
+            (game for game in state_client.list_games(prefix).values()
+             if host is None or game["host"] == host),
+            key=lambda game: game["name"]
+        )
+        cache.put(games_key(prefix), all_games, generation)
+    return jsonify(all_games)
+
+
+@app.route("/games/<name>")
+def game(name):
+    """
+    Serves the current state of game `name` as JSON.
+    """
+    return jsonify(get_history(name)[-1])
+
+
+@app.route("/games/<name>/history")
+def game_history(name):
+    """
+    Serves the full history of game `name` as JSON.
+    """
+    return jsonify(get_history(name))
 
 
 @app.route("/")
@@ -121,7 +269,19 @@ def index():
     Serves the `index.html` which contains the
     JavaScript code to connect to the WebSocket.
     """
-    return render_template("index.html")
+    return render_template(
+        "index.html",
+        images=[asset_url(image) for image in GAME_IMAGES]
+    )
+
+
+@app.template_global()
+def asset_url(path):
+    """
+    Returns the URL of the fingerprinted static file `path`,
+    available in templates as `asset_url`.
+    """
+    return url_for("send_static", path=assets.fingerprinted_path(path))
 
 
 @app.route("/static/<path:path>")
@@ -129,13 +289,27 @@ def send_static(path):
     """
     Serves some static files, e.g. CSS, some
     images, and a JavaScript dependency.
+    Fingerprinted names are cached forever, plain names are revalidated
+    via ETag. Text files are served gzipped if the client accepts it.
     """
-    return send_from_directory("static", path)
+    asset, fingerprinted = assets.get(path)
+    if asset is None:
+        abort(404)
+    if asset.gzip_data is not None and "gzip" in request.accept_encodings:
+        response = Response(asset.gzip_data, mimetype=asset.mimetype)
+        response.headers["Content-Encoding"] = "gzip"
+        response.set_etag(asset.etag + "-gzip")
+    else:
+        response = Response(asset.data, mimetype=asset.mimetype)
+        response.set_etag(asset.etag)
+    response.vary.add("Accept-Encoding")
+    response.headers["Cache-Control"] = CACHE_CONTROL_IMMUTABLE \
+        if fingerprinted else CACHE_CONTROL_REVALIDATE
+    return response.make_conditional(request)
 
 
 if __name__ == "__main__":
-    set_up_zmq_subscription()
-    from gevent import pywsgi
-    from geventwebsocket.handler import WebSocketHandler
-    server = pywsgi.WSGIServer(("", 5000), app, handler_class=WebSocketHandler)
-    server.serve_forever()
+    PreforkServer(
+        ("", HTTP_PORT), WORKERS, run_worker,
+        run_subscriber if SUBSCRIBER else None
+    ).run()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3.5
+# encoding: utf-8
+
+import errno
+import logging
+import os
+import signal
+import socket
+import time
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+# The backlog of the shared listen socket
+LISTEN_BACKLOG = 1024
+
+# How long to wait in seconds before a crashed process is started again
+RESPAWN_DELAY = 1
+
+# How long to wait in seconds for the processes to exit on shutdown
+SHUTDOWN_TIMEOUT = 10
+
+
+class PreforkServer:
+    """
+    A pre-fork master, short `PreforkServer`.
+    The master binds the listen socket and forks `workers` worker processes
+    which all accept connections on it, and optionally one subscriber
+    process. Processes which exit are started again, `SIGTERM` and `SIGINT`
+    stop all of them. The master itself serves nothing.
+
+    Arguments:
+        address: The address to listen on, a tuple of host and port.
+        workers: The number of worker processes.
+        worker: The main function of a worker, called with the listen socket.
+        subscriber: The main function of the subscriber, or None.
+    """
+
+    def __init__(self, address, workers, worker, subscriber=None):
+        """Initializes the master, nothing is started yet."""
+        self._address = address
+        self._workers = workers
+        self._worker = worker
+        self._subscriber = subscriber
+        self._children = {}
+        self._stopping = False
+
+    def _listen(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(self._address)
+        listener.listen(LISTEN_BACKLOG)
+        return listener
+
+    def _spawn(self, role, target, *args):
+        """
+        Fork a process running `target` with `args`.
+
+        Arguments:
+            role: The role of the process, `subscriber` or `worker`.
+            target: The main function of the process.
+            args: The arguments to call `target` with.
+        Returns:
+            -
+        """
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            status = 0
+            try:
+                target(*args)
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else 1
+            except BaseException:  # pylint: disable=broad-except
+                LOGGER.exception("The {} process failed".format(role))
+                status = 1
+            finally:
+                os._exit(status)
+        self._children[pid] = (role, target, args)
+        LOGGER.info("Started {} process {}".format(role, pid))
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    def run(self):
+        """
+        Start all processes and supervise them until stopped.
+        """
+        listener = self._listen()
+        LOGGER.info("Listening on {}:{} with {} workers".format(
+            self._address[0], self._address[1], self._workers
+        ))
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        if self._subscriber is not None:
+            self._spawn("subscriber", self._subscriber)
+        for _ in range(self._workers):
+            self._spawn("worker", self._worker, listener)
+        deadline = None
+        while self._children:
+            if self._stopping and deadline is None:
+                deadline = time.time() + SHUTDOWN_TIMEOUT
+            if deadline is not None and time.time() > deadline:
+                for pid in self._children:
+                    os.kill(pid, signal.SIGKILL)
+                deadline = float("inf")
+            try:
+                pid, status = os.waitpid(-1, 0 if deadline is None else os.WNOHANG)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            if pid == 0:
+                time.sleep(0.1)
+                continue
+            # gevent's cooperative `waitpid` may report a child more than once
+            if pid not in self._children:
+                continue
+            role, target, args = self._children.pop(pid)
+            if self._stopping:
+                continue
+            LOGGER.warning("The {} process {} exited with status {}, restarting".format(
+                role, pid, status
+            ))
+            time.sleep(RESPAWN_DELAY)
+            if not self._stopping:
+                self._spawn(role, target, *args)
+        listener.close()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3.5
+# encoding: utf-8
+
+import logging
+
+from collections import Counter
+
+from cache import LRUCache
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+# Game states, see `hangman-tp-py`
+GAME_STATE_ONGOING = 1
+GAME_STATE_WON = 2
+GAME_STATE_LOST = 3
+
+# The default number of players and words served
+DEFAULT_TOP = 10
+
+# The number of deleted games remembered, see `Leaderboard`
+DELETED_GAMES = 1024
+
+
+class PlayerStats:
+    """
+    The results of one player, short `PlayerStats`.
+    """
+
+    def __init__(self):
+        """Initializes all counters with zero."""
+        self.hosted = 0
+        self.wins = 0
+        self.losses = 0
+        self.misses = 0
+
+    @property
+    def played(self):
+        return self.wins + self.losses
+
+    def to_dict(self):
+        """
+        Return dictionary presentation of the counters.
+
+        Returns:
+            A dictionary presentation of the counters.
+        """
+        return {
+            "hosted": self.hosted,
+            "played": self.played,
+            "wins": self.wins,
+            "losses": self.losses,
+            "average_misses": self.misses / self.played if self.played else 0.0,
+        }
+
+
+class Leaderboard:
+    """
+    Statistics over all games, updated incrementally from `GameUpdate`s.
+    Only the state of every game seen is kept, so each update is counted
+    in constant time without reading any history:
+    - A game seen for the first time, or ongoing again after it had
+      ended (deleted and created anew), counts as a new game.
+    - A game changing from ongoing to won or lost counts as a result
+      of its guesser, and its word counts as played.
+    Games are identified by host and name, so a game migrated to another
+    address isn't counted twice. The state of a deleted or pruned game is
+    forgotten, only the last `DELETED_GAMES` are remembered, as a
+    migration deletes a game at one address and sets it at another in
+    any order within a block.
+    """
+
+    def __init__(self):
+        """Initializes empty statistics."""
+        # Host and name of every game mapped to its address and state
+        self._states = {}
+        # Addresses mapped to the host and name of their game
+        self._keys = {}
+        self._deleted = LRUCache(DELETED_GAMES)
+        self._players = {}
+        self.words = Counter()
+        self.games = 0
+        self.won = 0
+        self.lost = 0
+
+    def _player(self, key):
+        if key not in self._players:
+            self._players[key] = PlayerStats()
+        return self._players[key]
+
+    def update(self, update):
+        """
+        Count a game update.
+
+        Arguments:
+            update: The `GameUpdate`.
+        Returns:
+            -
+        """
+        game = update.game
+        if game is None:
+            # Deleted games keep their results
+            key = self._keys.pop(update.address, None)
+            if key in self._states and self._states[key][0] == update.address:
+                self._deleted.put(key, self._states.pop(key)[1])
+            return
+        key = (game["host"], game["name"])
+        previous = self._states[key][1] if key in self._states \
+            else self._deleted.get(key)
+        if key in self._deleted:
+            self._deleted.invalidate(key)
+        state = game["state"]
+        self._states[key] = (update.address, state)
+        self._keys[update.address] = key
+        if previous is None or \
+                (previous != GAME_STATE_ONGOING and state == GAME_STATE_ONGOING):
+            self.games += 1
+            if game["host"]:
+                self._player(game["host"]).hosted += 1
+        if state == GAME_STATE_ONGOING or previous in (GAME_STATE_WON, GAME_STATE_LOST):
+            return
+        self.words[game["word"].lower()] += 1
+        if state == GAME_STATE_WON:
+            self.won += 1
+        else:
+            self.lost += 1
+        if not game["guesser"]:
+            # Games finished before guessers were recorded
+            return
+        player = self._player(game["guesser"])
+        if state == GAME_STATE_WON:
+            player.wins += 1
+        else:
+            player.losses += 1
+        player.misses += len(game["misses"])
+        LOGGER.debug("Player '{}' finished game '{}'".format(
+            game["guesser"], game["name"]
+        ))
+
+    def seed(self, update):
+        """
+        Count a game read at startup, unless an update of it was counted
+        already, which is newer than the state read.
+
+        Arguments:
+            update: The `GameUpdate`.
+        Returns:
+            -
+        """
+        key = (update.game["host"], update.game["name"])
+        if key in self._states or key in self._deleted:
+            return
+        self.update(update)
+
+    def to_dict(self, top=DEFAULT_TOP):
+        """
+        Return dictionary presentation of the statistics.
+
+        Arguments:
+            top: The number of players and words to include.
+        Returns:
+            A dictionary with the totals, the players with the
+            most wins and the most played words.
+        """
+        players = sorted(
+            self._players.items(),
+            key=lambda item: (-item[1].wins, item[1].losses, item[0])
+        )[:top]
+        leaders = []
+        for key, player in players:
+            entry = player.to_dict()
+            entry["player"] = key
+            leaders.append(entry)
+        return {
+            "games": self.games,
+            "won": self.won,
+            "lost": self.lost,
+            "players": leaders,
+            "words": [
+                {"word": word, "count": count}
+                for word, count in self.words.most_common(top)
+            ],
+        }
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3.5
+# encoding: utf-8
+
+"""
+The validator event subscription and the local channel to the workers.
+
+Exactly one process, the subscriber, owns the subscription to the validator.
+It decodes state deltas into game updates and publishes them on a local ZMQ
+PUB socket, every web worker receives them on a SUB socket:
+
+    validator -> subscriber (DEALER) -> PUB -> SUB (worker 1..N)
+
+Both hops drop messages once their high-water mark is reached, and the
+channel loses whatever is published while a worker or the subscriber restarts.
+Every message on the channel therefore carries the epoch of the publisher, a
+random id chosen when it starts, and a sequence number. A worker which sees a
+gap or a new epoch drops everything it derived from earlier updates. The
+subscriber starts a new epoch itself if the block of a state delta doesn't
+follow the previous one, i.e. the validator dropped events or switched forks.
+
+All sockets are created by the functions here, nothing is created at import
+time, so the processes can be forked before any socket exists.
+"""
+
+import json
+import logging
+import os
+
+import zmq.green as zmq
+from sawtooth_sdk.protobuf.events_pb2 import (
+    EventSubscription, EventFilter, EventList
+)
+from sawtooth_sdk.protobuf.client_event_pb2 import (
+    ClientEventsSubscribeRequest, ClientEventsSubscribeResponse
+)
+from sawtooth_sdk.protobuf.network_pb2 import PingResponse
+from sawtooth_sdk.protobuf.validator_pb2 import Message
+
+from client import HM_NAMESPACE, _make_hm_host_prefix
+from events import (
+    EVENT_TYPE_BLOCK_COMMIT, EVENT_TYPE_STATE_DELTA, AddressTable, GameUpdate,
+    block_commit, decode_changes, state_changes
+)
+from tracing import (
+    STAGE_RECEIVED, TRACE_EVENT_TYPE, trace, trace_ids_by_address
+)
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+
+# Our local Sawtooth validator to connect to
+VALIDATOR_URL = os.environ.get("HM_VALIDATOR_URL", "tcp://validator:4004")
+
+# High-water marks of the validator socket, i.e. the maximum number of
+# messages queued in each direction. Once reached the validator drops events
+# for us instead of buffering them without limit.
+ZMQ_RCVHWM = int(os.environ.get("HM_ZMQ_RCVHWM", 1000))
+ZMQ_SNDHWM = int(os.environ.get("HM_ZMQ_SNDHWM", 100))
+
+# The local endpoint the subscriber publishes game updates on and the
+# maximum number of updates queued for each worker
+UPDATES_ENDPOINT = os.environ.get(
+    "HM_UPDATES_ENDPOINT", "ipc:///tmp/hangman-web-updates"
+)
+UPDATES_HWM = int(os.environ.get("HM_UPDATES_HWM", 1000))
+
+# The public keys of the hosts whose games we subscribe to, comma separated.
+# If empty we subscribe to all games. Only games stored under address
+# scheme v2 can be selected by host.
+SUBSCRIBE_HOSTS = [
+    host.strip() for host in os.environ.get("HM_SUBSCRIBE_HOSTS", "").split(",")
+    if host.strip()
+]
+
+# The topics of the local channel
+TOPIC_UPDATE = b"update"
+TOPIC_PING = b"ping"
+
+
+def subscription_prefixes(hosts=SUBSCRIBE_HOSTS):
+    """
+    Returns the tuple of address prefixes to subscribe to, either the whole
+    Hangman address space or only the prefixes of `hosts`.
+    """
+    if not hosts:
+        return (HM_NAMESPACE,)
+    return tuple(_make_hm_host_prefix(host) for host in hosts)
+
+
+def subscription_pattern(hosts=SUBSCRIBE_HOSTS):
+    """
+    Returns the address pattern to subscribe to, matching the
+    prefixes returned by `subscription_prefixes`.
+    """
+    return "^({}).*".format("|".join(subscription_prefixes(hosts)))
+
+
+def set_up_zmq_subscription(socket, pattern):
+    """
+    This sends a subscription request to ZMQ.
+    See: https://sawtooth.hyperledger.org/docs/core/
+    releases/latest/app_developers_guide/zmq_event_subscription.html
+
+    Besides state deltas the `hm/trace` events of traced
+    transactions are subscribed to, for the same addresses, and
+    the block commit events of all blocks to detect dropped events.
+
+    Arguments:
+        socket: The DEALER socket connected to the validator.
+        pattern: The address pattern to subscribe to.
+    Returns:
+        -
+    """
+    subscriptions = [
+        EventSubscription(
+            event_type=event_type,
+            filters=[
+                EventFilter(
+                    key="address",
+                    match_string=pattern,
+                    filter_type=EventFilter.REGEX_ANY)
+            ])
+        for event_type in (EVENT_TYPE_STATE_DELTA, TRACE_EVENT_TYPE)
+    ]
+    subscriptions.append(EventSubscription(event_type=EVENT_TYPE_BLOCK_COMMIT))
+
+    request = ClientEventsSubscribeRequest(
+        subscriptions=subscriptions
+    ).SerializeToString()
+
+    correlation_id = "123"  # This must be unique for all in-process requests
+    msg = Message(
+        correlation_id=correlation_id,
+        message_type=Message.MessageType.CLIENT_EVENTS_SUBSCRIBE_REQUEST,
+        content=request
+    )
+
+    socket.send_multipart([msg.SerializeToString()])
+
+    resp = socket.recv_multipart()[-1]
+
+    msg = Message()
+    msg.ParseFromString(resp)
+
+    if msg.message_type != \
+       Message.MessageType.CLIENT_EVENTS_SUBSCRIBE_RESPONSE:
+        print("Unexpected message type")
+        exit(1)
+
+    response = ClientEventsSubscribeResponse()
+    response.ParseFromString(msg.content)
+
+    if response.status != ClientEventsSubscribeResponse.OK:
+        print("Subscription failed: {}".format(response.response_message))
+        exit(1)
+
+    LOGGER.debug("Setting up ZMQ subscription successful")
+
+
+def sequence_frame(epoch, seq):
+    """
+    Returns the frame carrying the `epoch` and sequence number `seq`
+    of a message on the local channel.
+    """
+    return "{}:{}".format(epoch, seq).encode("utf-8")
+
+
+class Publisher:
+    """
+    The sending end of the local channel, short `Publisher`.
+    Messages are sent as the topic, the sequence frame and the data.
+
+    Arguments:
+        ctx: The ZMQ context.
+        endpoint: The endpoint to bind to.
+    """
+
+    def __init__(self, ctx, endpoint=UPDATES_ENDPOINT):
+        """Initializes the publisher and binds it to `endpoint`."""
+        self._socket = ctx.socket(zmq.PUB)
+        self._socket.setsockopt(zmq.SNDHWM, UPDATES_HWM)
+        self._socket.bind(endpoint)
+        self.new_epoch()
+
+    def new_epoch(self):
+        """
+        Start a new epoch, the workers drop everything they derived
+        from the updates published so far once they receive its first
+        message.
+        """
+        self.epoch = os.urandom(8).hex()
+        self._seq = 0
+
+    def _send(self, topic, *frames):
+        self._seq += 1
+        self._socket.send_multipart(
+            [topic, sequence_frame(self.epoch, self._seq)] + list(frames)
+        )
+
+    def update(self, update, trace_ids=None):
+        """
+        Publish a game update, it's sent as JSON. The trace ids
+        are sent as a JSON list in a third frame, if any.
+
+        Arguments:
+            update: The `GameUpdate`.
+            trace_ids: The trace ids of the transactions which caused it.
+        Returns:
+            -
+        """
+        frames = [json.dumps(update._asdict()).encode("utf-8")]
+        if trace_ids:
+            frames.append(json.dumps(trace_ids).encode("utf-8"))
+        self._send(TOPIC_UPDATE, *frames)
+
+    def ping(self):
+        """Publish that the validator pinged us."""
+        self._send(TOPIC_PING, b"")
+
+
+def listen_for_events(socket, publisher, prefixes=None):
+    """
+    Receives messages from the validator, this is the only reader of the
+    socket. State deltas are decoded into game updates which are handed
+    to `publisher`. Ping requests are answered.
+    A state delta event carries all state changes of its block, the
+    subscription only selects which events are sent, so the changes
+    are filtered by `prefixes` again. If a block doesn't follow the
+    previous one the publisher starts a new epoch.
+
+    Arguments:
+        socket: The DEALER socket connected to the validator.
+        publisher: The `Publisher` to hand updates to.
+        prefixes: The address prefixes of the games to publish,
+            by default `subscription_prefixes()`.
+    Returns:
+        -
+    """
+    if prefixes is None:
+        prefixes = subscription_prefixes()
+    table = AddressTable()
+    block_id = None
+    LOGGER.debug("Entering ZMQ loop")
+    while True:
+        resp = socket.recv_multipart()[-1]
+
+        msg = Message()
+        msg.ParseFromString(resp)
+
+        if msg.message_type == Message.CLIENT_EVENTS:
+            events = EventList()
+            events.ParseFromString(msg.content)
+            LOGGER.debug("Received events")
+            block = block_commit(events.events)
+            if block is not None:
+                if block_id is not None and block.get("previous_block_id") != block_id:
+                    LOGGER.warning(
+                        "Block {} doesn't follow block {}, starting a new "
+                        "epoch".format(block.get("block_num"), block_id[:8])
+                    )
+                    publisher.new_epoch()
+                block_id = block.get("block_id")
+            traces = trace_ids_by_address(events.events)
+            for update in decode_changes(state_changes(events.events, prefixes), table):
+                LOGGER.debug("Received update of '{}'".format(update.name))
+                trace_ids = traces.get(update.address)
+                for trace_id in trace_ids or []:
+                    trace(trace_id, STAGE_RECEIVED)
+                publisher.update(update, trace_ids)
+        elif msg.message_type == Message.PING_REQUEST:
+            LOGGER.debug("Received ping request")
+            socket.send_multipart([Message(
+                correlation_id=msg.correlation_id,
+                message_type=Message.PING_RESPONSE,
+                content=PingResponse().SerializeToString()
+            ).SerializeToString()])
+            publisher.ping()
+        else:
+            LOGGER.warn("Unexpected message type '{}'".format(
+                msg.message_type
+            ))
+
+
+def run_subscriber(url=VALIDATOR_URL, endpoint=UPDATES_ENDPOINT):
+    """
+    The main function of the subscriber process, subscribes to the
+    validator at `url` and publishes game updates on `endpoint`.
+    """
+    ctx = zmq.Context()
+    socket = ctx.socket(zmq.DEALER)
+    socket.setsockopt(zmq.RCVHWM, ZMQ_RCVHWM)
+    socket.setsockopt(zmq.SNDHWM, ZMQ_SNDHWM)
+    socket.connect(url)
+    publisher = Publisher(ctx, endpoint)
+    set_up_zmq_subscription(socket, subscription_pattern())
+    listen_for_events(socket, publisher)
+
+
+def receive_updates(on_update, on_ping, on_resync, endpoint=UPDATES_ENDPOINT):
+    """
+    The receiving end of the local channel, runs in every worker.
+
+    Arguments:
+        on_update: Called with the `GameUpdate`, its JSON encoding and
+            the trace ids of the transactions which caused it, or None.
+        on_ping: Called when the validator pinged the subscriber.
+        on_resync: Called before the next message is handled if messages
+            were dropped or the publisher started a new epoch.
+        endpoint: The endpoint to connect to.
+    Returns:
+        -
+    """
+    ctx = zmq.Context()
+    socket = ctx.socket(zmq.SUB)
+    socket.setsockopt(zmq.RCVHWM, UPDATES_HWM)
+    socket.setsockopt(zmq.SUBSCRIBE, b"")
+    socket.connect(endpoint)
+    LOGGER.debug("Receiving updates from '{}'".format(endpoint))
+    last_epoch, last_seq = None, 0
+    while True:
+        frames = socket.recv_multipart()
+        topic, sequence, data = frames[:3]
+        epoch, seq = sequence.decode("utf-8").split(":")
+        seq = int(seq)
+        if last_epoch is not None and (epoch != last_epoch or seq != last_seq + 1):
+            LOGGER.warning("Missed updates, epoch {} message {} follows epoch "
+                           "{} message {}".format(epoch, seq, last_epoch, last_seq))
+            on_resync()
+        last_epoch, last_seq = epoch, seq
+        if topic == TOPIC_UPDATE:
+            data = data.decode("utf-8")
+            trace_ids = json.loads(frames[3].decode("utf-8")) \
+                if len(frames) > 3 else None
+            on_update(GameUpdate(**json.loads(data)), data, trace_ids)
+        elif topic == TOPIC_PING:
+            on_ping()
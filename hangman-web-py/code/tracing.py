@@ -0,0 +1,81 @@
+#!/usr/bin/env python3.5
+# encoding: utf-8
+
+"""
+Opt-in latency tracing of game updates.
+
+Clients may stamp a trace id into their transactions. For those the
+transaction processor emits a `hm/trace` event carrying the trace id and the
+address of the game, next to the state delta of the same block. The web
+service records when the subscriber receives the update and when it was sent
+to each WebSocket client. Records are logged as `TRACE` followed by a JSON
+object, see `hmtrace.py` of `hangman-cli-py` which collects them.
+"""
+
+import json
+import logging
+import time
+
+# Set up logging
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.StreamHandler())
+LOGGER.setLevel(logging.INFO)
+
+# The marker trace records are logged with, see `hangman-tp-py`
+TRACE_MARKER = "TRACE"
+
+# The event emitted by the transaction processor for traced transactions
+TRACE_EVENT_TYPE = "hm/trace"
+
+# The stages of a traced transaction recorded by the web service
+STAGE_RECEIVED = "web_received"
+STAGE_DELIVERED = "web_delivered"
+
+
+def trace(trace_id, stage, **fields):
+    """
+    Log a trace record, stamped with the current time.
+
+    Arguments:
+        trace_id: The trace id of the transaction.
+        stage: The stage reached, e.g. `STAGE_DELIVERED`.
+        fields: Further fields of the record.
+    Returns:
+        -
+    """
+    record = dict(fields, trace_id=trace_id, stage=stage, ts=time.time())
+    LOGGER.info("{} {}".format(TRACE_MARKER, json.dumps(record, sort_keys=True)))
+
+
+def trace_ids_by_address(evts):
+    """
+    Collects the trace ids of the traced transactions of a block.
+
+    Arguments:
+        evts: An iterable of `Event` instances.
+    Returns:
+        A dictionary of game addresses mapped to lists of trace ids.
+    """
+    traces = {}
+    for event in evts:
+        if event.event_type != TRACE_EVENT_TYPE:
+            continue
+        attributes = {a.key: a.value for a in event.attributes}
+        if "trace_id" in attributes and "address" in attributes:
+            traces.setdefault(attributes["address"], []).append(
+                attributes["trace_id"]
+            )
+    return traces
+
+
+class TracedData(str):
+    """
+    The JSON encoding of a game update which carries the trace ids of the
+    transactions that caused it. It's handed through the WebSocket fan-out
+    like any other update, the sender records its delivery.
+    """
+
+    def __new__(cls, data, trace_ids):
+        traced = super().__new__(cls, data)
+        traced.trace_ids = trace_ids
+        return traced